@@ -1,23 +1,114 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 import httpx
 import os
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
 import asyncio
 import math
+import heapq
+import bisect
+import codecs
+import csv
+import sqlite3
+import threading
+import hashlib
+import random
+import mmap
+import tempfile
+import struct
+import sys
+import re
+import unicodedata
+from array import array
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from typing import Dict, List, Set, Tuple
 from dataclasses import dataclass
-from collections import defaultdict
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque, OrderedDict
+from contextlib import aclosing, asynccontextmanager
+import importlib.util
 import time
-from functools import lru_cache
+from functools import lru_cache, wraps
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, but the atomic replace still protects readers
+    fcntl = None
+from difflib import SequenceMatcher
 
 load_dotenv()
 
-app = FastAPI()
+# Outbound HTTP connection pool settings (per upstream client)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+HTTP2_ENABLED = (
+    os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")
+    and importlib.util.find_spec("h2") is not None
+)
+
+# One pooled client per upstream host
+UPSTREAMS = ("open_meteo", "geocoding", "nominatim", "overpass", "groq")
+
+class UpstreamClients:
+    """Application-scoped httpx clients with keep-alive connection pooling"""
+
+    def __init__(self, names: Tuple[str, ...]):
+        self.names = names
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _build(self, name: str) -> httpx.AsyncClient:
+        """Create a pooled client, honouring per-upstream overrides like HTTP_MAX_CONNECTIONS_GROQ"""
+        suffix = name.upper()
+        limits = httpx.Limits(
+            max_connections=int(os.getenv(f"HTTP_MAX_CONNECTIONS_{suffix}", HTTP_MAX_CONNECTIONS)),
+            max_keepalive_connections=int(
+                os.getenv(f"HTTP_MAX_KEEPALIVE_CONNECTIONS_{suffix}", HTTP_MAX_KEEPALIVE_CONNECTIONS)
+            ),
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        return httpx.AsyncClient(limits=limits, http2=HTTP2_ENABLED)
+
+    async def start(self):
+        """Open all upstream clients (called from the app lifespan)"""
+        for name in self.names:
+            if name not in self._clients:
+                self._clients[name] = self._build(name)
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Return the shared client for an upstream"""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            # Created lazily when used outside the lifespan (e.g. from scripts)
+            client = self._clients[name] = self._build(name)
+        return client
+
+    async def close(self):
+        """Close all clients and release pooled connections"""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+http_clients = UpstreamClients(UPSTREAMS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_clients.start()
+    persistence_task = await start_place_persistence()
+    gazetteer_task = await start_gazetteer()
+    yield
+    gazetteer_task.cancel()
+    await asyncio.gather(gazetteer_task, return_exceptions=True)
+    await stop_place_persistence(persistence_task)
+    await http_clients.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -80,7 +171,35 @@ class ForecastInsightRequest(BaseModel):
     class Config:
         extra = 'ignore'
 
-class LocationWeatherRequest(BaseModel):
+class ScoringConditions(BaseModel):
+    """One reading (an hour, a day, or current conditions) to rate activities against"""
+    date: Optional[str] = None
+    temperature: float
+    windSpeed: float
+    precipitation: float = 0  # inches
+    humidity: float = 50
+    uvIndex: float = 5
+    
+    class Config:
+        extra = 'ignore'
+
+class ActivityScoreRequest(BaseModel):
+    conditions: List[ScoringConditions]  # e.g. the forecast days from /api/weather/fetch
+    activities: Optional[List[str]] = None  # Defaults to every activity
+    period: Literal["hour", "day"] = "hour"  # "day" when precipitation is a daily total
+    
+    class Config:
+        extra = 'ignore'
+
+class WeatherViewOptions(BaseModel):
+    """Optional response shaping shared by the weather endpoints"""
+    fields: Optional[List[str]] = None  # Response sections: current, forecast, historical, cell, hourly
+    hourly: Optional[List[str]] = None  # Open-Meteo hourly variables, e.g. temperature_2m, uv_index
+    forecastDays: Optional[int] = None  # Upstream horizon in days (1-16)
+    hours: Optional[int] = None  # Hourly series length from the current hour
+    hourlyStep: int = 1  # Downsample the hourly series into buckets of this many hours
+
+class LocationWeatherRequest(WeatherViewOptions):
     lat: float
     lon: float
     locationName: str
@@ -114,6 +233,31 @@ class PlaceSearchRequest(BaseModel):
     class Config:
         extra = 'ignore'
 
+class BatchWeatherLocation(BaseModel):
+    lat: float
+    lon: float
+    locationName: str = ""
+    
+    class Config:
+        extra = 'ignore'
+
+class BatchWeatherRequest(WeatherViewOptions):
+    locations: List[BatchWeatherLocation]
+    
+    class Config:
+        extra = 'ignore'
+
+class BestTimesRequest(BaseModel):
+    lat: float
+    lon: float
+    activities: Optional[List[str]] = None  # Defaults to every activity
+    windowHours: int = 3  # Length of each window
+    top: int = 3  # Windows per activity
+    days: int = 7  # Forecast horizon to search
+    
+    class Config:
+        extra = 'ignore'
+
 class BulkLoadRequest(BaseModel):
     places: List[dict]
     
@@ -122,6 +266,32 @@ class BulkLoadRequest(BaseModel):
 # Free APIs - No API keys required
 OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
 GEOCODING_API_URL = "https://geocoding-api.open-meteo.com/v1/search"
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_HEADERS = {"User-Agent": "WeatherWiseApp/1.0"}
+
+# Nominatim usage policy allows at most 1 request per second per application
+NOMINATIM_RATE_LIMIT = float(os.getenv("NOMINATIM_RATE_LIMIT", "1.0"))  # requests per second
+NOMINATIM_BURST = int(os.getenv("NOMINATIM_BURST", "1"))
+# External geocoding: sequential (Open-Meteo then Nominatim), hedged (Nominatim fires after
+# GEOCODING_HEDGE_DELAY if Open-Meteo hasn't answered) or race (both at once)
+GEOCODING_MODE = os.getenv("GEOCODING_MODE", "hedged").lower()
+GEOCODING_HEDGE_DELAY = float(os.getenv("GEOCODING_HEDGE_DELAY", "0.4"))  # seconds
+GEOCODING_MERGE_GRACE = float(os.getenv("GEOCODING_MERGE_GRACE", "0.1"))  # wait for the loser to merge results
+GEOCODING_DEADLINE = float(os.getenv("GEOCODING_DEADLINE", "8.0"))
+# Place search fan-out: parallel term lookups, overall deadline, early stop target
+PLACES_FANOUT_CONCURRENCY = int(os.getenv("PLACES_FANOUT_CONCURRENCY", "4"))
+PLACES_SEARCH_DEADLINE = float(os.getenv("PLACES_SEARCH_DEADLINE", "8.0"))  # seconds
+PLACES_TARGET_RESULTS = 15
+
+# Place ingestion backend: one structured bbox query per area instead of term x pattern lookups
+PLACE_PROVIDER = os.getenv("PLACE_PROVIDER", "overpass").lower()  # overpass | fixture | nominatim
+OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+OVERPASS_CATEGORY_LIMIT = int(os.getenv("OVERPASS_CATEGORY_LIMIT", "250"))  # Elements per tag clause
+PLACE_FIXTURE_PATH = os.getenv(
+    "PLACE_FIXTURE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "overpass_kochi.json")
+)
+PLACE_AREA_RADIUS_DEG = 0.5  # Same half-width as the old Nominatim viewbox
+PLACE_AREA_SNAP_DEG = 0.25  # Area centers snap to this grid so nearby searches share one query
 
 ACTIVITY_SEARCH_TERMS = {
     'beach': [
@@ -151,7 +321,7 @@ ACTIVITY_SEARCH_TERMS = {
 }
 
 # Performance Enhancement: Data Structures for Fast Activity Search
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ActivityPlace:
     name: str
     lat: float
@@ -159,17 +329,723 @@ class ActivityPlace:
     type: str
     address: str
     activity_type: str
-    relevance_score: float = 0.0
+    source: str = "unknown"  # Where the record came from: seed, overpass, nominatim, bulk, ...
+
+@dataclass(frozen=True, slots=True)
+class ScoredPlace:
+    """One search hit: the indexed record plus this query's score and distance"""
+    place_id: int
+    place: ActivityPlace
+    relevance_score: float
+    distance_km: float
+
+EARTH_RADIUS_KM = 6371.0
+
+def to_unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    """Point on the unit sphere; no seams at the poles or the antimeridian"""
+    phi, lam = math.radians(lat), math.radians(lon)
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+def km_to_chord(distance_km: float) -> float:
+    """Straight-line (chord) length on the unit sphere for a great-circle distance"""
+    angle = min(distance_km / EARTH_RADIUS_KM, math.pi)
+    return 2 * math.sin(angle / 2)
+
+def chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+def ranges_to_indices(starts: List[int], stops: List[int]) -> np.ndarray:
+    """Concatenation of arange(start, stop) for each half-open range, without a Python loop"""
+    starts_arr = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(stops, dtype=np.int64) - starts_arr
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(int(lengths.sum()), dtype=np.int64) - np.repeat(offsets - starts_arr, lengths)
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Vectorized great-circle distance in km from one point to arrays of points"""
+    lat_r, lats_r = np.radians(lat), np.radians(lats)
+    dlat = lats_r - lat_r
+    dlon = np.radians(lons - lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat_r) * np.cos(lats_r) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+class SpatialIndex:
+    """3D KD-trees over unit-sphere vectors with radius and k-nearest-neighbor queries.
+
+    Each tree is static and sorted kdbush style, then stored as flat x/y/z/id
+    arrays (~32 bytes per point). Inserts land in a small pending buffer; full
+    buffers become new trees and equal-sized trees are merged (Bentley-Saxe),
+    so inserts stay cheap and a query only visits O(log n) trees.
+    """
+
+    NODE_SIZE = 32
+    RANGE_LEAF_SIZE = 512  # Radius queries hand subtrees this small to NumPy instead of descending
+    SMALL_RADIUS_KM = 1.0  # Radius queries up to this walk the tree point by point
+    PENDING_LIMIT = 256
+
+    def __init__(self):
+        self._trees: List[Tuple[array, array, array, array]] = []  # (xs, ys, zs, ids) in tree order
+        self._pending: List[Tuple[float, float, float, int]] = []
+
+    def __len__(self) -> int:
+        return sum(len(t[3]) for t in self._trees) + len(self._pending)
+
+    def add(self, item_id: int, lat: float, lon: float):
+        x, y, z = to_unit_vector(lat, lon)
+        self._pending.append((x, y, z, item_id))
+        if len(self._pending) >= self.PENDING_LIMIT:
+            self.build()
+
+    def extend(self, items: List[Tuple[int, float, float]]):
+        """Add many (id, lat, lon) points and build once"""
+        for item_id, lat, lon in items:
+            x, y, z = to_unit_vector(lat, lon)
+            self._pending.append((x, y, z, item_id))
+        self.build()
+
+    def build(self, compact: bool = False):
+        """Turn pending points into a tree; compact=True merges everything into one tree"""
+        points = self._pending
+        self._pending = []
+        while self._trees and (compact or len(self._trees[-1][3]) <= len(points)):
+            points = list(zip(*self._trees.pop())) + points
+        if points:
+            self._sort(points)
+            self._trees.append((
+                array("d", [p[0] for p in points]),
+                array("d", [p[1] for p in points]),
+                array("d", [p[2] for p in points]),
+                array("q", [p[3] for p in points]),
+            ))
+
+    def _sort(self, points: List[Tuple[float, float, float, int]]):
+        stack = [(0, len(points) - 1, 0)]
+        while stack:
+            left, right, axis = stack.pop()
+            if right - left <= self.NODE_SIZE:
+                continue
+            points[left:right + 1] = sorted(points[left:right + 1], key=lambda p: p[axis])
+            mid = (left + right) >> 1
+            next_axis = (axis + 1) % 3
+            stack.append((left, mid - 1, next_axis))
+            stack.append((mid + 1, right, next_axis))
+
+    def _points_within(self, tree, query: Tuple[float, float, float], r: float, found: list):
+        """Append (id, d2) for every point of one tree within chord r, kdbush style"""
+        xs, ys, zs, ids = tree
+        axes = (xs, ys, zs)
+        qx, qy, qz = query
+        r2 = r * r
+        stack = [(0, len(ids) - 1, 0)]
+        while stack:
+            left, right, axis = stack.pop()
+            if right - left <= self.NODE_SIZE:
+                for i in range(left, right + 1):
+                    d2 = (xs[i] - qx) ** 2 + (ys[i] - qy) ** 2 + (zs[i] - qz) ** 2
+                    if d2 <= r2:
+                        found.append((ids[i], d2))
+                continue
+            mid = (left + right) >> 1
+            d2 = (xs[mid] - qx) ** 2 + (ys[mid] - qy) ** 2 + (zs[mid] - qz) ** 2
+            if d2 <= r2:
+                found.append((ids[mid], d2))
+            split = axes[axis][mid]
+            next_axis = (axis + 1) % 3
+            if query[axis] - r <= split:
+                stack.append((left, mid - 1, next_axis))
+            if query[axis] + r >= split:
+                stack.append((mid + 1, right, next_axis))
+
+    def _ranges_within(self, tree, query: Tuple[float, float, float], r2: float) -> Tuple[List[int], List[int]]:
+        """Half-open index ranges of one tree that may hold points within the query sphere.
+
+        Each node's bounding box comes from its ancestors' split planes: boxes
+        entirely inside the sphere are taken whole, boxes entirely outside are
+        skipped, and only straddling leaves are returned for exact filtering.
+        """
+        xs, ys, zs, ids = tree
+        axes = (xs, ys, zs)
+        qx, qy, qz = query
+        starts, stops = [], []
+        stack = [(0, len(ids) - 1, 0, (-1.0, -1.0, -1.0), (1.0, 1.0, 1.0))]
+        while stack:
+            left, right, axis, lo, hi = stack.pop()
+            if left > right:
+                continue
+            (lx, ly, lz), (hx, hy, hz) = lo, hi
+            dx = lx - qx if qx < lx else (qx - hx if qx > hx else 0.0)
+            dy = ly - qy if qy < ly else (qy - hy if qy > hy else 0.0)
+            dz = lz - qz if qz < lz else (qz - hz if qz > hz else 0.0)
+            if dx * dx + dy * dy + dz * dz > r2:
+                continue
+            fx, fy, fz = max(qx - lx, hx - qx), max(qy - ly, hy - qy), max(qz - lz, hz - qz)
+            if fx * fx + fy * fy + fz * fz <= r2 or right - left <= self.RANGE_LEAF_SIZE:
+                starts.append(left)
+                stops.append(right + 1)
+                continue
+            mid = (left + right) >> 1
+            starts.append(mid)
+            stops.append(mid + 1)
+            split = axes[axis][mid]
+            next_axis = (axis + 1) % 3
+            stack.append((left, mid - 1, next_axis, lo, hi[:axis] + (split,) + hi[axis + 1:]))
+            stack.append((mid + 1, right, next_axis, lo[:axis] + (split,) + lo[axis + 1:], hi))
+        return starts, stops
+
+    def within(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Ids and distances (km) of every point within radius_km, as NumPy arrays.
+
+        Wide queries only collect index ranges in the tree walk; distances for
+        the points in them are computed and filtered in one vectorized pass per
+        tree. Lookups up to SMALL_RADIUS_KM (duplicate checks) find a handful
+        of points, so a plain point-by-point walk is cheaper for them.
+        """
+        qx, qy, qz = query = to_unit_vector(lat, lon)
+        r = km_to_chord(radius_km)
+        r2 = r * r
+        found_ids, found_d2 = [], []
+        near: List[Tuple[int, float]] = []
+        for tree in self._trees:
+            if radius_km <= self.SMALL_RADIUS_KM:
+                self._points_within(tree, query, r, near)
+                continue
+            starts, stops = self._ranges_within(tree, query, r2)
+            if not starts:
+                continue
+            idx = ranges_to_indices(starts, stops)
+            xs, ys, zs = (np.frombuffer(column, dtype=np.float64) for column in tree[:3])
+            d2 = (xs[idx] - qx) ** 2 + (ys[idx] - qy) ** 2 + (zs[idx] - qz) ** 2
+            keep = d2 <= r2
+            found_ids.append(np.frombuffer(tree[3], dtype=np.int64)[idx[keep]])
+            found_d2.append(d2[keep])
+        for x, y, z, item_id in self._pending:
+            d2 = (x - qx) ** 2 + (y - qy) ** 2 + (z - qz) ** 2
+            if d2 <= r2:
+                near.append((item_id, d2))
+        if near:
+            found_ids.append(np.fromiter((item_id for item_id, _ in near), dtype=np.int64, count=len(near)))
+            found_d2.append(np.fromiter((d2 for _, d2 in near), dtype=np.float64, count=len(near)))
+        if not found_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        d2 = np.concatenate(found_d2)
+        return np.concatenate(found_ids), 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(d2) / 2))
+
+    def nearest(self, lat: float, lon: float, k: int, max_km: Optional[float] = None) -> List[Tuple[int, float]]:
+        """The k nearest (id, distance_km), closest first"""
+        if k <= 0:
+            return []
+        qx, qy, qz = query = to_unit_vector(lat, lon)
+        bound = km_to_chord(max_km) ** 2 if max_km is not None else float("inf")
+        heap: List[Tuple[float, int]] = []  # max-heap of (-d2, id)
+
+        def offer(x, y, z, item_id):
+            d2 = (x - qx) ** 2 + (y - qy) ** 2 + (z - qz) ** 2
+            if d2 > bound:
+                return
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, item_id))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, item_id))
+
+        for point in self._pending:
+            offer(*point)
+        for xs, ys, zs, ids in self._trees:
+            axes = (xs, ys, zs)
+            # (left, right, axis, lower bound on squared distance to anything in the range)
+            stack = [(0, len(ids) - 1, 0, 0.0)]
+            while stack:
+                left, right, axis, min_d2 = stack.pop()
+                if min_d2 > (-heap[0][0] if len(heap) == k else bound):
+                    continue
+                if right - left <= self.NODE_SIZE:
+                    for i in range(left, right + 1):
+                        offer(xs[i], ys[i], zs[i], ids[i])
+                    continue
+                mid = (left + right) >> 1
+                offer(xs[mid], ys[mid], zs[mid], ids[mid])
+                delta = query[axis] - axes[axis][mid]
+                next_axis = (axis + 1) % 3
+                near, far = ((left, mid - 1), (mid + 1, right)) if delta <= 0 else ((mid + 1, right), (left, mid - 1))
+                # Push the far side first so the near side is explored first
+                stack.append((far[0], far[1], next_axis, max(min_d2, delta * delta)))
+                stack.append((near[0], near[1], next_axis, min_d2))
+        return [(item_id, chord_to_km(math.sqrt(-neg_d2))) for neg_d2, item_id in sorted(heap, reverse=True)]
+
+    def stats(self) -> dict:
+        return {"size": len(self), "trees": len(self._trees), "pending": len(self._pending)}
+
+    def memory_bytes(self) -> int:
+        """Approximate footprint: tree arrays plus pending (x, y, z, id) tuples"""
+        tree_bytes = sum(sys.getsizeof(column) for tree in self._trees for column in tree)
+        pending_bytes = sys.getsizeof(self._pending) + sum(
+            sys.getsizeof(p) + sum(sys.getsizeof(v) for v in p) for p in self._pending
+        )
+        return tree_bytes + pending_bytes
+
+# Insert-time deduplication: same activity, within this radius, and similar names
+PLACE_MERGE_RADIUS_KM = float(os.getenv("PLACE_MERGE_RADIUS_M", "150")) / 1000.0
+PLACE_MERGE_NAME_SIMILARITY = float(os.getenv("PLACE_MERGE_NAME_SIMILARITY", "0.85"))
+
+@lru_cache(maxsize=65536)
+def normalize_place_name(name: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    decomposed = unicodedata.normalize("NFKD", name)
+    ascii_name = "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^\w\s]", " ", ascii_name).split())
+
+def names_match(a: str, b: str) -> bool:
+    """Whether two normalized names likely refer to the same place"""
+    if a == b:
+        return True
+    if set(re.findall(r"\d+", a)) != set(re.findall(r"\d+", b)):
+        return False  # "Camp Site 12" vs "Camp Site 13" are different places
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    if tokens_a and tokens_b and (tokens_a <= tokens_b or tokens_b <= tokens_a):
+        return True  # "Cherai Beach" vs "Cherai Beach Kerala"
+    return SequenceMatcher(None, a, b).ratio() >= PLACE_MERGE_NAME_SIMILARITY
+
+def dedupe_place_dicts(places: List[dict], radius_km: float = PLACE_MERGE_RADIUS_KM,
+                       same_name=names_match) -> List[dict]:
+    """Drop result dicts that are the same place as an earlier one (nearby + similar name)"""
+    kept: List[Tuple[dict, str]] = []
+    for place in places:
+        norm = normalize_place_name(place["name"])
+        duplicate = any(
+            abs(place["lat"] - kept_place["lat"]) * 111.32 <= radius_km  # Cheap reject before name/distance
+            and same_name(norm, kept_norm)
+            and haversine_km(place["lat"], place["lon"], kept_place["lat"], kept_place["lon"]) <= radius_km
+            for kept_place, kept_norm in kept
+        )
+        if not duplicate:
+            kept.append((place, norm))
+    return [place for place, _ in kept]
+
+def dedupe_city_dicts(places: List[dict], radius_km: float) -> List[dict]:
+    """dedupe_place_dicts for cities: only the same accent-folded name counts as a match.
+
+    City radii are wide and token subsets are common between distinct cities
+    ("Delhi" and "New Delhi" are 3 km apart), so similar names aren't enough.
+    """
+    return dedupe_place_dicts(places, radius_km=radius_km, same_name=str.__eq__)
+
+def bounded_edit_distance(a: str, b: str, max_edits: int) -> int:
+    """Damerau-Levenshtein distance, or max_edits + 1 once it is exceeded"""
+    if abs(len(a) - len(b)) > max_edits:
+        return max_edits + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], prev2[j - 2] + 1)  # Transposition
+        if min(row) > max_edits:
+            return max_edits + 1
+        prev2, prev = prev, row
+    return prev[-1]
+
+class TextIndex:
+    """Inverted index over normalized name tokens with prefix, infix and typo-tolerant lookup.
+
+    Each document has up to four weighted fields (e.g. name, region, country). Postings map
+    token id -> doc_id * 4 + field; a sorted vocabulary answers prefix queries with bisect and
+    a trigram index over the vocabulary answers infix and fuzzy ones.
+    """
+    MAX_FIELDS = 4
+    MAX_PREFIX_TOKENS = 2000  # Cap on vocabulary expansion for very short prefixes
+    EXACT, PREFIX, INFIX, FUZZY = 1.0, 0.8, 0.5, 0.6
+    INFIX_MIN_LENGTH = 4  # Shorter query tokens only match as prefixes
+
+    def __init__(self):
+        self.token_ids: Dict[str, int] = {}
+        self.tokens: List[str] = []
+        self.postings: List[array] = []
+        self.trigrams: Dict[str, array] = defaultdict(lambda: array("l"))
+        self.names: Dict[int, str] = {}
+        self.field_weights: Dict[int, Tuple[float, ...]] = {}
+        self.weights: Dict[int, float] = {}
+        self._sorted: List[Tuple[str, int]] = []
+        self._sorted_dirty = False
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def _grams(token: str, padded: bool = True) -> Set[str]:
+        text = f"^{token}$" if padded else token
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _token_id(self, token: str) -> int:
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            token_id = len(self.tokens)
+            self.token_ids[token] = token_id
+            self.tokens.append(token)
+            self.postings.append(array("l"))
+            for gram in self._grams(token):
+                self.trigrams[gram].append(token_id)
+            self._sorted_dirty = True
+        return token_id
+
+    def add(self, doc_id: int, fields: List[Tuple[str, float]], weight: float = 0.0):
+        """Index a document; fields are (text, weight) with the display name first"""
+        fields = fields[:self.MAX_FIELDS]
+        self.names[doc_id] = normalize_place_name(fields[0][0]) if fields else ""
+        self.field_weights[doc_id] = tuple(w for _, w in fields)
+        if weight:
+            self.weights[doc_id] = weight
+        for field, (text, _) in enumerate(fields):
+            for token in set(normalize_place_name(text or "").split()):
+                self.postings[self._token_id(token)].append(doc_id * self.MAX_FIELDS + field)
+
+    def prepare(self):
+        """Sort the vocabulary for prefix lookups (done lazily by the first query otherwise)"""
+        if self._sorted_dirty:
+            self._sorted = sorted(self.token_ids.items())
+            self._sorted_dirty = False
+
+    @classmethod
+    def token_matches_text(cls, token: str, text_token: str) -> bool:
+        """The prefix and infix rules of _token_matches for one pair of normalized tokens"""
+        return text_token.startswith(token) or (len(token) >= cls.INFIX_MIN_LENGTH and token in text_token)
+
+    def matches_only_by_typo(self, token: str) -> bool:
+        """Whether a query token matches nothing by prefix or infix but something within edit distance"""
+        return not self._substring_matches(token) and bool(self._token_matches(token))
+
+    def _substring_matches(self, token: str) -> Dict[int, float]:
+        matches: Dict[int, float] = {}
+        self.prepare()
+        start = bisect.bisect_left(self._sorted, (token, -1))
+        for vocab_token, token_id in self._sorted[start:start + self.MAX_PREFIX_TOKENS]:
+            if not vocab_token.startswith(token):
+                break
+            matches[token_id] = self.EXACT if vocab_token == token else self.PREFIX
+        if len(token) >= self.INFIX_MIN_LENGTH:
+            # Infix: every trigram of the query appears in the candidate token
+            gram_sets = sorted((self.trigrams.get(g, ()) for g in self._grams(token, padded=False)), key=len)
+            if gram_sets and gram_sets[0]:
+                candidates = set(gram_sets[0]).intersection(*gram_sets[1:])
+                for token_id in candidates:
+                    if token_id not in matches and token in self.tokens[token_id]:
+                        matches[token_id] = self.INFIX
+        return matches
+
+    def _token_matches(self, token: str) -> Dict[int, float]:
+        """Vocabulary token ids matching one query token, with a match-quality score"""
+        matches = self._substring_matches(token)
+        if not matches and len(token) >= self.INFIX_MIN_LENGTH:
+            # Typo tolerance: candidates sharing enough trigrams, verified by edit distance
+            max_edits = 1 if len(token) < 8 else 2
+            grams = self._grams(token)
+            shared = defaultdict(int)
+            for gram in grams:
+                for token_id in self.trigrams.get(gram, ()):
+                    shared[token_id] += 1
+            needed = max(1, len(grams) - 3 * max_edits)
+            for token_id, count in shared.items():
+                if count < needed:
+                    continue
+                candidate = self.tokens[token_id]
+                # Allow the typo in a prefix of a longer token ("thiruvanan" -> "thiruvananthapuram")
+                edits = min(bounded_edit_distance(token, candidate, max_edits),
+                            bounded_edit_distance(token, candidate[:len(token)], max_edits))
+                if edits <= max_edits:
+                    matches[token_id] = self.FUZZY - 0.15 * edits
+        return matches
+
+    def search(self, query: str, limit: int = 15) -> List[Tuple[int, float]]:
+        """Ranked (doc_id, score); every query token must match some field of the document"""
+        normalized = normalize_place_name(query)
+        query_tokens = normalized.split()
+        if not query_tokens:
+            return []
+        scores: Optional[Dict[int, float]] = None
+        for token in query_tokens:
+            best: Dict[int, float] = {}
+            for token_id, quality in self._token_matches(token).items():
+                for posting in self.postings[token_id]:
+                    doc_id, field = divmod(posting, self.MAX_FIELDS)
+                    if scores is not None and doc_id not in scores:
+                        continue
+                    score = quality * self.field_weights[doc_id][field]
+                    if score > best.get(doc_id, 0.0):
+                        best[doc_id] = score
+            if scores is None:
+                scores = best
+            else:
+                scores = {doc_id: scores[doc_id] + s for doc_id, s in best.items()}
+            if not scores:
+                return []
+        ranked = []
+        for doc_id, score in scores.items():
+            name = self.names[doc_id]
+            if name == normalized:
+                score += 1.0
+            elif name.startswith(normalized):
+                score += 0.5
+            elif name.replace(" ", "").startswith(normalized.replace(" ", "")):
+                score += 0.3
+            score += self.weights.get(doc_id, 0.0)
+            ranked.append((score, -len(name), doc_id))
+        return [(doc_id, score) for score, _, doc_id in heapq.nlargest(limit, ranked)]
+
+    def stats(self) -> dict:
+        return {"documents": len(self.names), "tokens": len(self.tokens), "trigrams": len(self.trigrams)}
+
+    def memory_bytes(self) -> int:
+        return (sys.getsizeof(self.token_ids) + sum(sys.getsizeof(t) for t in self.tokens)
+                + sum(p.itemsize * len(p) for p in self.postings)
+                + sum(g.itemsize * len(g) for g in self.trigrams.values())
+                + sys.getsizeof(self.names) + sys.getsizeof(self.field_weights))
+
+class StringTable:
+    """Interns repeated strings (types, activities, addresses) as small integer ids"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def intern(self, value: str) -> int:
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return string_id
+
+    def memory_bytes(self) -> int:
+        return (sys.getsizeof(self.values) + sys.getsizeof(self.ids)
+                + sum(sys.getsizeof(v) for v in self.values))
+
+class PlaceStore:
+    """Array-backed place records addressed by integer id.
+
+    Coordinates live in NumPy columns and type/address/activity are interned
+    string ids, so indexes only hold ints and ActivityPlace objects are
+    materialized on demand.
+    """
+
+    COLUMNS = ("lat", "lon", "type_id", "address_id", "activity_id", "source_id")
+
+    def __init__(self, capacity: int = 1024):
+        self.lat = np.empty(capacity, dtype=np.float64)
+        self.lon = np.empty(capacity, dtype=np.float64)
+        self.type_id = np.empty(capacity, dtype=np.int32)
+        self.address_id = np.empty(capacity, dtype=np.int32)
+        self.activity_id = np.empty(capacity, dtype=np.int32)
+        self.source_id = np.empty(capacity, dtype=np.int32)
+        self.names: List[str] = []
+        self.strings = StringTable()
+        self.activities = StringTable()  # Separate table keeps activity ids small and dense
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def append(self, place: ActivityPlace) -> int:
+        place_id = len(self.names)
+        if place_id >= len(self.lat):
+            capacity = len(self.lat) * 2
+            for column in self.COLUMNS:
+                setattr(self, column, np.resize(getattr(self, column), capacity))
+        self.lat[place_id] = place.lat
+        self.lon[place_id] = place.lon
+        self.type_id[place_id] = self.strings.intern(place.type)
+        self.address_id[place_id] = self.strings.intern(place.address)
+        self.activity_id[place_id] = self.activities.intern(place.activity_type)
+        self.source_id[place_id] = self.strings.intern(place.source)
+        self.names.append(place.name)
+        return place_id
+
+    def set_address(self, place_id: int, address: str):
+        self.address_id[place_id] = self.strings.intern(address)
+
+    def get(self, place_id: int) -> ActivityPlace:
+        strings = self.strings.values
+        return ActivityPlace(
+            name=self.names[place_id],
+            lat=float(self.lat[place_id]),
+            lon=float(self.lon[place_id]),
+            type=strings[self.type_id[place_id]],
+            address=strings[self.address_id[place_id]],
+            activity_type=self.activities.values[self.activity_id[place_id]],
+            source=strings[self.source_id[place_id]]
+        )
+
+    def memory_usage(self) -> dict:
+        n = len(self.names)
+        return {
+            "columns": sum(getattr(self, c)[:n].nbytes for c in self.COLUMNS),
+            "allocated_columns": sum(getattr(self, c).nbytes for c in self.COLUMNS),
+            "names": sys.getsizeof(self.names) + sum(sys.getsizeof(s) for s in self.names),
+            "interned_strings": self.strings.memory_bytes() + self.activities.memory_bytes(),
+        }
+
+# Persistent place store (SQLite + R-tree). Empty PLACES_DB_PATH disables persistence.
+PLACES_DB_PATH = os.getenv(
+    "PLACES_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "places.db")
+)
+PLACES_DB_PRELOAD = os.getenv("PLACES_DB_PRELOAD", "lazy").lower()  # lazy | eager
+PLACES_DB_TILE_DEG = 1.0  # Lazy loading granularity
+PLACES_DB_LOAD_CHUNK = int(os.getenv("PLACES_DB_LOAD_CHUNK", "250"))  # Places indexed per event loop slice
+PLACES_DB_FLUSH_INTERVAL = float(os.getenv("PLACES_DB_FLUSH_INTERVAL", "2.0"))  # seconds
+
+class PlaceDatabase:
+    """SQLite place store with an R-tree index for bbox loads.
+
+    WAL mode lets every uvicorn worker read the same file concurrently while
+    new places are appended in small write-behind batches.
+    """
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._pending: List[ActivityPlace] = []
+        self.written = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA mmap_size=268435456")  # Read pages through a shared mmap
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS places (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    lat REAL NOT NULL,
+                    lon REAL NOT NULL,
+                    type TEXT NOT NULL,
+                    address TEXT NOT NULL,
+                    activity_type TEXT NOT NULL,
+                    source TEXT NOT NULL DEFAULT 'unknown',
+                    UNIQUE (name, lat, lon, activity_type)
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS places_rtree USING rtree(
+                    id, min_lat, max_lat, min_lon, max_lon
+                );
+                CREATE TRIGGER IF NOT EXISTS places_rtree_insert AFTER INSERT ON places BEGIN
+                    INSERT INTO places_rtree VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+                END;
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(places)")}
+            if "source" not in columns:  # Databases created before provenance was tracked
+                conn.execute("ALTER TABLE places ADD COLUMN source TEXT NOT NULL DEFAULT 'unknown'")
+            self._conn = conn
+        return self._conn
+
+    def enqueue(self, place: ActivityPlace):
+        """Queue a newly discovered place for the next flush"""
+        with self._lock:
+            self._pending.append(place)
+            full = len(self._pending) >= self.BATCH_SIZE
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write queued places; duplicates are ignored by the UNIQUE constraint"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO places (name, lat, lon, type, address, activity_type, source) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(p.name, p.lat, p.lon, p.type, p.address, p.activity_type, p.source) for p in pending]
+                )
+            self.written += len(pending)
+            return len(pending)
+
+    def load_bbox(self, south: float, west: float, north: float, east: float) -> List[ActivityPlace]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT p.name, p.lat, p.lon, p.type, p.address, p.activity_type, p.source "
+                "FROM places_rtree r JOIN places p ON p.id = r.id "
+                "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?",
+                (south, north, west, east)
+            ).fetchall()
+        return [ActivityPlace(*row) for row in rows]
+
+    def iter_all(self, batch_size: int = 10000):
+        """Yield every stored place in batches (eager preload)"""
+        with self._lock:
+            cursor = self._connection().execute(
+                "SELECT name, lat, lon, type, address, activity_type, source FROM places ORDER BY id"
+            )
+            rows = cursor.fetchmany(batch_size)
+        while rows:
+            yield [ActivityPlace(*row) for row in rows]
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM places").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def tiles_around(lat: float, lon: float, radius_km: float, tile_deg: float = PLACES_DB_TILE_DEG) -> List[Tuple[int, int]]:
+    """Tile keys (row, col) covering a radius, wrapping across the antimeridian"""
+    dlat = radius_km / 111.32
+    dlon = dlat / max(math.cos(math.radians(min(89.9, abs(lat) + dlat))), 1e-6)
+    cols_total = int(round(360 / tile_deg))
+    rows = range(math.floor(max(-90.0, lat - dlat) / tile_deg), math.floor(min(89.999, lat + dlat) / tile_deg) + 1)
+    if 2 * dlon >= 360:
+        cols = range(cols_total)
+    else:
+        first = math.floor((lon - dlon + 180) / tile_deg)
+        last = math.floor((lon + dlon + 180) / tile_deg)
+        cols = sorted({c % cols_total for c in range(first, last + 1)})
+    return [(row, col) for row in rows for col in cols]
+
+# Nearby search radii: any place within SEARCH_RADIUS_KM, places of the searched
+# activity within SEARCH_ACTIVITY_RADIUS_KM; the scan starts small and widens
+SEARCH_RADIUS_KM = 20.0
+SEARCH_ACTIVITY_RADIUS_KM = 50.0
+SEARCH_INITIAL_RADIUS_KM = 2.0
+# Name bonus: the activity string appears in the name, or one of its words does
+NAME_MATCH_BONUS, NAME_WORD_BONUS = 0.3, 0.2
 
 # Enhance the search engine to prioritize local results
 class ActivitySearchEngine:
     def __init__(self):
-        # Spatial indexing using simple grid system
-        self.grid_size = 0.1  # ~11km grid
-        self.places_by_grid: Dict[Tuple[int, int], List[ActivityPlace]] = defaultdict(list)
-        self.places_by_activity: Dict[str, List[ActivityPlace]] = defaultdict(list)
-        self.name_index: Dict[str, ActivityPlace] = {}
-        self.coordinate_index: Dict[Tuple[float, float], ActivityPlace] = {}
+        # Compact record store; every index below refers to places by integer id
+        self.store = PlaceStore()
+        # Spatial indexing: one KD-tree over all places plus one per activity
+        self.spatial_index = SpatialIndex()
+        self.activity_spatial_index: Dict[str, SpatialIndex] = defaultdict(SpatialIndex)
+        # Ranked text search over place names and addresses
+        self.name_index = TextIndex()
+        # hash(name, coordinates, activity) -> id, so reloaded places aren't indexed twice
+        self.record_index: Dict[int, int] = {}
+        # Other sources merged into a canonical record: id -> [{source, name, lat, lon}]
+        self.provenance: Dict[int, List[dict]] = {}
+        self.merge_stats = {"exact_duplicates": 0, "merged": 0}
+        # Bumped on every insert or merge; versions the scored result cache
+        self.version = 0
+
+        # Optional persistent store: new places are written through, tiles load lazily
+        self.database: Optional[PlaceDatabase] = None
+        self.loaded_tiles: Set[Tuple[int, int]] = set()
+        self.fully_loaded = False
+
+        # Scored results per (query, index version); entries are immutable so they can be shared
+        self._result_cache: "OrderedDict[tuple, List[ScoredPlace]]" = OrderedDict()
+        self.result_cache_size = 256
+        # Name match bonus of every place for each known activity, in tenths, kept current on insert;
+        # other activity strings are scored for the search candidates only
+        self._name_bonus: Dict[str, array] = {activity: array("b") for activity in ACTIVITY_SEARCH_TERMS}
         
         # Activity synonyms for better matching
         self.activity_synonyms = {
@@ -181,75 +1057,180 @@ class ActivitySearchEngine:
             'photo': {'viewpoint', 'scenic', 'landmark', 'monument', 'vista', 'panorama', 'lookout', 'view'}
         }
     
-    # ... (keep existing methods the same, but enhance calculate_relevance)
-    
-    def calculate_relevance(self, place: ActivityPlace, query: str, center_lat: float, center_lon: float) -> float:
-        """Calculate relevance score for a place with Kerala priority"""
-        score = 0.0
-        
-        # Distance score (closer = better)
-        distance = self._calculate_distance(place.lat, place.lon, center_lat, center_lon)
-        distance_score = max(0, 1 - (distance / 100.0))  # Normalize to 100km range
-        score += distance_score * 0.4
-        
-        # Name matching score
-        name_lower = place.name.lower()
-        query_lower = query.lower()
-        
-        if query_lower in name_lower:
-            score += 0.3
-        elif any(word in name_lower for word in query_lower.split()):
-            score += 0.2
-        
-        # Activity type matching
-        if place.activity_type in query_lower:
-            score += 0.3
-        
-        # Kerala priority boost
-        if "kerala" in place.address.lower() or "kerala" in name_lower:
-            score += 0.2
-        
-        # Ernakulam/Kochi specific boost
-        if any(city in place.address.lower() for city in ['ernakulam', 'kochi', 'cochin']):
-            score += 0.1
-        
-        return min(1.0, score)  # Cap at 1.0
-        
-    def _get_grid_key(self, lat: float, lon: float) -> Tuple[int, int]:
-        """Convert coordinates to grid key"""
-        return (int(lat / self.grid_size), int(lon / self.grid_size))
-    
-    def _get_nearby_grids(self, lat: float, lon: float, radius_km: float = 10.0) -> List[Tuple[int, int]]:
-        """Get nearby grid cells for a given location"""
-        center_grid = self._get_grid_key(lat, lon)
-        grids = []
-        
-        # Calculate grid range based on radius
-        grid_range = max(1, int(radius_km / 11.0))  # Approximate km per grid
-        
-        for lat_offset in range(-grid_range, grid_range + 1):
-            for lon_offset in range(-grid_range, grid_range + 1):
-                grids.append((center_grid[0] + lat_offset, center_grid[1] + lon_offset))
-                
-        return grids
-    
-    def add_place(self, place: ActivityPlace):
-        """Add a place to search indexes"""
-        grid_key = self._get_grid_key(place.lat, place.lon)
+    def _batch_cell(self, activity: str, lat: float, lon: float) -> Tuple[str, int, int]:
+        cell_deg = PLACE_MERGE_RADIUS_KM / 111.32
+        return (activity, math.floor(lat / cell_deg), math.floor(lon / cell_deg))
+
+    def _find_duplicate(self, place: ActivityPlace, norm_name: str,
+                        batch_cells: Optional[Dict[Tuple[str, int, int], List[int]]]) -> Optional[int]:
+        """Canonical id of an indexed place with the same activity, nearby and with a similar name"""
+        candidates = []
+        index = self.activity_spatial_index.get(place.activity_type)
+        if index is not None:
+            candidates.extend(index.within(place.lat, place.lon, PLACE_MERGE_RADIUS_KM)[0].tolist())
+        if batch_cells:
+            # Places from the current batch are not in the spatial index yet
+            activity, row, col = self._batch_cell(place.activity_type, place.lat, place.lon)
+            span = math.ceil(1 / max(math.cos(math.radians(place.lat)), 0.01))
+            for r in (row - 1, row, row + 1):
+                for c in range(col - span, col + span + 1):
+                    candidates.extend(batch_cells.get((activity, r, c), ()))
+        for candidate in candidates:
+            if (names_match(norm_name, normalize_place_name(self.store.names[candidate]))
+                    and self._calculate_distance(place.lat, place.lon, self.store.lat[candidate],
+                                                 self.store.lon[candidate]) <= PLACE_MERGE_RADIUS_KM):
+                return candidate
+        return None
+
+    def _merge_into(self, place_id: int, place: ActivityPlace):
+        """Record a duplicate's provenance on the canonical place and fill in missing details"""
+        self.provenance.setdefault(place_id, []).append(
+            {"source": place.source, "name": place.name, "lat": place.lat, "lon": place.lon}
+        )
+        if place.address and not self.store.strings.values[self.store.address_id[place_id]]:
+            self.store.set_address(place_id, place.address)
+        self.merge_stats["merged"] += 1
+        self.version += 1
+
+    def _index_record(self, place: ActivityPlace, persist: bool,
+                      batch_cells: Optional[Dict[Tuple[str, int, int], List[int]]] = None) -> Tuple[int, bool]:
+        """Store a place (or merge it into a duplicate) and update the non-spatial indexes; returns (id, is_new)"""
         coord_key = (round(place.lat, 4), round(place.lon, 4))
+        record_key = hash((place.name, coord_key, place.activity_type))
+        existing = self.record_index.get(record_key)
+        if existing is not None:
+            self.merge_stats["exact_duplicates"] += 1
+            return existing, False
+        duplicate = self._find_duplicate(place, normalize_place_name(place.name), batch_cells)
+        if duplicate is not None:
+            self._merge_into(duplicate, place)
+            self.record_index[record_key] = duplicate
+            return duplicate, False
+        place_id = self.store.append(place)
+        for activity, bonus in self._name_bonus.items():
+            bonus.append(round(self._name_score(place.name, activity) * 10))
+        self.record_index[record_key] = place_id
+        self.version += 1
+        if batch_cells is not None:
+            batch_cells[self._batch_cell(place.activity_type, place.lat, place.lon)].append(place_id)
+        if persist and self.database is not None:
+            self.database.enqueue(place)
         
-        # Add to spatial index
-        self.places_by_grid[grid_key].append(place)
-        
-        # Add to activity index
-        self.places_by_activity[place.activity_type].append(place)
-        
-        # Add to other indexes
-        self.name_index[place.name.lower()] = place
-        self.coordinate_index[coord_key] = place
+        self.name_index.add(place_id, [(place.name, 1.0), (place.address, 0.4)])
+        return place_id, True
+
+    def add_place(self, place: ActivityPlace, persist: bool = True) -> int:
+        """Add a place to search indexes (and the persistent store unless it came from there)"""
+        place_id, is_new = self._index_record(place, persist)
+        if is_new:
+            # Add to spatial indexes
+            self.spatial_index.add(place_id, place.lat, place.lon)
+            self.activity_spatial_index[place.activity_type].add(place_id, place.lat, place.lon)
+        return place_id
+
+    def add_places(self, places: List[ActivityPlace], persist: bool = True) -> int:
+        """Add a batch of places, building the spatial indexes once for the whole batch"""
+        added: List[Tuple[int, float, float]] = []
+        by_activity: Dict[str, List[Tuple[int, float, float]]] = defaultdict(list)
+        batch_cells: Dict[Tuple[str, int, int], List[int]] = defaultdict(list)
+        for place in places:
+            place_id, is_new = self._index_record(place, persist, batch_cells)
+            if is_new:
+                point = (place_id, place.lat, place.lon)
+                added.append(point)
+                by_activity[place.activity_type].append(point)
+        self.spatial_index.extend(added)
+        for activity, points in by_activity.items():
+            self.activity_spatial_index[activity].extend(points)
+        return len(added)
+
+    def search_names(self, query: str, limit: int = 10) -> List[Tuple[ActivityPlace, float]]:
+        """Indexed places whose name or address matches a text query, best first"""
+        return [(self.store.get(i), score) for i, score in self.name_index.search(query, limit)]
+
+    def get_provenance(self, place_id: int) -> List[dict]:
+        """Sources that contributed to a canonical place, the canonical record first"""
+        place = self.store.get(place_id)
+        canonical = {"source": place.source, "name": place.name, "lat": place.lat, "lon": place.lon}
+        return [canonical] + self.provenance.get(place_id, [])
+
+    def attach_database(self, database: PlaceDatabase):
+        self.database = database
+
+    def load_all_from_database(self) -> int:
+        """Eager warm start: index every stored place, then compact the spatial trees once"""
+        if self.database is None:
+            return 0
+        loaded = 0
+        for batch in self.database.iter_all():
+            loaded += self.add_places(batch, persist=False)
+        self.spatial_index.build(compact=True)
+        for index in self.activity_spatial_index.values():
+            index.build(compact=True)
+        self.fully_loaded = True
+        return loaded
+
+    def _missing_tiles(self, lat: float, lon: float, radius_km: float) -> List[Tuple[int, int]]:
+        if self.database is None or self.fully_loaded:
+            return []
+        return [tile for tile in tiles_around(lat, lon, radius_km) if tile not in self.loaded_tiles]
+
+    def _read_tile(self, row: int, col: int) -> List[ActivityPlace]:
+        south, west = row * PLACES_DB_TILE_DEG, col * PLACES_DB_TILE_DEG - 180.0
+        return self.database.load_bbox(south, west, south + PLACES_DB_TILE_DEG, west + PLACES_DB_TILE_DEG)
+
+    def ensure_loaded(self, lat: float, lon: float, radius_km: float):
+        """Lazily pull the stored tiles around a query point into memory"""
+        for row, col in self._missing_tiles(lat, lon, radius_km):
+            self.add_places(self._read_tile(row, col), persist=False)
+            self.loaded_tiles.add((row, col))
+
+    async def load_tiles(self, lat: float, lon: float, radius_km: float):
+        """ensure_loaded for the event loop: the SQLite read runs in a thread, each
+        tile loads once however many requests want it, and indexing yields between chunks"""
+        # One tile at a time: concurrent tiles would each index a chunk per loop turn
+        for row, col in self._missing_tiles(lat, lon, radius_km):
+            await upstream_flights.do(
+                "place_tiles", f"{row},{col}", lambda row=row, col=col: self._load_tile(row, col)
+            )
+
+    async def _load_tile(self, row: int, col: int):
+        if (row, col) in self.loaded_tiles:
+            return
+        places = await asyncio.to_thread(self._read_tile, row, col)
+        for start in range(0, len(places), PLACES_DB_LOAD_CHUNK):
+            self.add_places(places[start:start + PLACES_DB_LOAD_CHUNK], persist=False)
+            await asyncio.sleep(0)
+        self.loaded_tiles.add((row, col))
+
+    def get_place(self, place_id: int) -> ActivityPlace:
+        return self.store.get(place_id)
     
+    def _name_score(self, name: str, query_lower: str) -> float:
+        """Name matching part of the relevance score"""
+        name_lower = name.lower()
+        if query_lower in name_lower:
+            return NAME_MATCH_BONUS
+        if any(word in name_lower for word in query_lower.split()):
+            return NAME_WORD_BONUS
+        return 0.0
+
+    def _name_scores(self, query_lower: str, ids: np.ndarray) -> np.ndarray:
+        """Name match bonus for candidate ids: a table lookup for known activities, otherwise
+        scored on the spot (same rules as _name_score, inlined for speed)"""
+        bonus = self._name_bonus.get(query_lower)
+        if bonus is not None:
+            return np.frombuffer(bonus, dtype=np.int8)[ids] / 10.0
+        names = self.store.names
+        words = query_lower.split()
+        lowered = [names[place_id].lower() for place_id in ids.tolist()]
+        return np.array([
+            NAME_MATCH_BONUS if query_lower in name else (NAME_WORD_BONUS if any(w in name for w in words) else 0.0)
+            for name in lowered
+        ], dtype=np.float64)
+
     def calculate_relevance(self, place: ActivityPlace, query: str, center_lat: float, center_lon: float) -> float:
-        """Calculate relevance score for a place"""
+        """Calculate relevance score for a place (scalar version of the scoring in search_nearby)"""
         score = 0.0
         
         # Distance score (closer = better)
@@ -258,13 +1239,8 @@ class ActivitySearchEngine:
         score += distance_score * 0.4
         
         # Name matching score
-        name_lower = place.name.lower()
         query_lower = query.lower()
-        
-        if query_lower in name_lower:
-            score += 0.3
-        elif any(word in name_lower for word in query_lower.split()):
-            score += 0.2
+        score += self._name_score(place.name, query_lower)
         
         # Activity type matching
         if place.activity_type in query_lower:
@@ -286,46 +1262,110 @@ class ActivitySearchEngine:
         c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
         return R * c
     
-    async def search_nearby(self, lat: float, lon: float, activity: str, limit: int = 15) -> List[ActivityPlace]:
+    async def search_nearby(self, lat: float, lon: float, activity: str, limit: int = 15) -> List[ScoredPlace]:
         """Fast search for activity places nearby"""
-        start_time = asyncio.get_event_loop().time()
-        
-        # Get nearby grids
-        nearby_grids = self._get_nearby_grids(lat, lon, radius_km=20.0)
-        
-        # Collect candidate places
-        candidates = []
-        for grid in nearby_grids:
-            if grid in self.places_by_grid:
-                candidates.extend(self.places_by_grid[grid])
+        start_time = time.perf_counter()
+        await self.load_tiles(lat, lon, SEARCH_ACTIVITY_RADIUS_KM)
+        results = self.search(lat, lon, activity, limit)
         
-        # Also check activity-specific places
-        if activity in self.places_by_activity:
-            activity_candidates = self.places_by_activity[activity]
-            # Filter by distance
-            for place in activity_candidates:
-                distance = self._calculate_distance(lat, lon, place.lat, place.lon)
-                if distance <= 50.0:  # Within 50km
-                    candidates.append(place)
+        # Log performance
+        search_time = (time.perf_counter() - start_time) * 1000
+        print(f"Local search completed in {search_time:.2f}ms, found {len(results)} places")
         
-        # Remove duplicates and calculate relevance
-        unique_places = {}
-        for place in candidates:
-            coord_key = (round(place.lat, 4), round(place.lon, 4))
-            if coord_key not in unique_places:
-                place.relevance_score = self.calculate_relevance(place, activity, lat, lon)
-                unique_places[coord_key] = place
+        return results
+
+    def search(self, lat: float, lon: float, activity: str, limit: int = 15) -> List[ScoredPlace]:
+        """Scored nearby search; never mutates indexed records, so it is safe to run concurrently"""
+        self.ensure_loaded(lat, lon, SEARCH_ACTIVITY_RADIUS_KM)
+        cache_key = (lat, lon, activity, limit, self.version)
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            self._result_cache.move_to_end(cache_key)
+            return cached
         
-        # Sort by relevance and distance
-        results = sorted(unique_places.values(), 
-                        key=lambda x: (-x.relevance_score, 
-                                    self._calculate_distance(lat, lon, x.lat, x.lon)))
+        # Candidates are anything within 20km plus activity-specific places within 50km.
+        # Relevance is 0.4 * (1 - distance / 50) plus name and activity bonuses, so
+        # once the k-th best score beats the most a place beyond the current radius
+        # could reach, the top k are final; the radius only grows until then.
+        store = self.store
+        query_lower = activity.lower()
+        activity_bonus = np.array(
+            [0.3 if name in query_lower else 0.0 for name in store.activities.values], dtype=np.float64
+        )
+        ceiling = NAME_MATCH_BONUS + float(activity_bonus.max(initial=0.0))
+        activity_index = self.activity_spatial_index.get(activity)
+        max_radius = SEARCH_ACTIVITY_RADIUS_KM if activity_index is not None else SEARCH_RADIUS_KM
+        radius = min(SEARCH_INITIAL_RADIUS_KM, max_radius)
+        while True:
+            ids, distances = self.spatial_index.within(lat, lon, min(radius, SEARCH_RADIUS_KM))
+            if radius > SEARCH_RADIUS_KM:
+                # Closer activity places are already in the all-places set
+                more_ids, more_distances = activity_index.within(lat, lon, radius)
+                beyond = more_distances > SEARCH_RADIUS_KM
+                ids = np.concatenate([ids, more_ids[beyond]])
+                distances = np.concatenate([distances, more_distances[beyond]])
+            # Records are merged at insert time, so candidates need no coordinate dedupe
+            scores = (
+                np.maximum(0.0, 1.0 - distances / 50.0) * 0.4
+                + self._name_scores(query_lower, ids)
+                + activity_bonus[store.activity_id[ids]]
+            )
+            if radius >= max_radius:
+                break
+            if len(ids) < limit:
+                radius = min(radius * 4, max_radius)
+                continue
+            # Past this distance nothing can outscore the current k-th best (which only rises)
+            kth_score = -np.partition(-scores, limit - 1)[limit - 1]
+            needed = 50.0 * (1.0 - (kth_score - ceiling) / 0.4)
+            if needed <= radius:
+                break
+            radius = min(needed, radius * 4, max_radius)
         
-        # Log performance
-        search_time = (asyncio.get_event_loop().time() - start_time) * 1000
-        print(f"Local search completed in {search_time:.2f}ms, found {len(results)} places")
+        results = []
+        if len(ids):
+            # Top-k by relevance, then distance
+            if len(ids) > limit:
+                top = np.argpartition(-scores, limit - 1)[:limit]
+            else:
+                top = np.arange(len(ids))
+            order = top[np.lexsort((distances[top], -scores[top]))]
+            for i in order:
+                place_id = int(ids[i])
+                results.append(ScoredPlace(place_id, store.get(place_id), float(scores[i]), float(distances[i])))
         
-        return results[:limit]
+        self._result_cache[cache_key] = results
+        if len(self._result_cache) > self.result_cache_size:
+            self._result_cache.popitem(last=False)
+        return results
+
+    def nearest_places(self, lat: float, lon: float, k: int = 10, activity: Optional[str] = None,
+                       max_km: Optional[float] = None) -> List[Tuple[ActivityPlace, float]]:
+        """k nearest places (optionally of one activity) with their distance in km"""
+        if max_km is not None:
+            self.ensure_loaded(lat, lon, max_km)
+        index = self.activity_spatial_index.get(activity) if activity else self.spatial_index
+        if index is None:
+            return []
+        return [(self.store.get(i), d) for i, d in index.nearest(lat, lon, k, max_km)]
+
+    def memory_usage(self) -> dict:
+        """Approximate bytes held by the record store and by each index"""
+        return {
+            "store": self.store.memory_usage(),
+            "spatial_index": self.spatial_index.memory_bytes(),
+            "activity_spatial_index": {k: v.memory_bytes() for k, v in self.activity_spatial_index.items()},
+            "name_index": self.name_index.memory_bytes(),
+            "record_index": sys.getsizeof(self.record_index),
+            "provenance": sys.getsizeof(self.provenance) + sum(sys.getsizeof(v) for v in self.provenance.values()),
+            "name_bonus": sum(len(bonus) for bonus in self._name_bonus.values()),
+        }
+
+    def index_stats(self) -> dict:
+        return {
+            "all": self.spatial_index.stats(),
+            "by_activity": {k: len(v) for k, v in self.activity_spatial_index.items()},
+        }
 # Define global locations at module level
 GLOBAL_LOCATIONS = [
     # Kerala Locations
@@ -373,69 +1413,516 @@ GLOBAL_LOCATIONS = [
     {"name": "Dubai", "lat": 25.2048, "lon": 55.2708, "country": "UAE", "emoji": "🏜️", "region": "Asia"},
 ]
 
+def build_location_index(locations: List[dict]) -> TextIndex:
+    """Text index over location names, regions and countries (doc id = list position)"""
+    index = TextIndex()
+    for i, loc in enumerate(locations):
+        index.add(i, [(loc["name"], 1.0), (loc.get("region", ""), 0.6), (loc.get("country", ""), 0.5)])
+    return index
+
+location_index = build_location_index(GLOBAL_LOCATIONS)
+
+# Offline gazetteer: a GeoNames cities dump compiled once into a memory-mapped binary.
+# Empty GAZETTEER_PATH disables it; the binary is rebuilt when GAZETTEER_SOURCE is newer.
+GAZETTEER_DIR = os.path.dirname(os.path.abspath(__file__))
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(GAZETTEER_DIR, "gazetteer.bin"))
+GAZETTEER_SOURCE = os.getenv(
+    "GAZETTEER_SOURCE", os.path.join(GAZETTEER_DIR, "fixtures", "geonames_cities_sample.txt")
+)
+GAZETTEER_ADMIN1_SOURCE = os.getenv(
+    "GAZETTEER_ADMIN1_SOURCE", os.path.join(GAZETTEER_DIR, "fixtures", "geonames_admin1_sample.txt")
+)
+GAZETTEER_COUNTRY_SOURCE = os.getenv(
+    "GAZETTEER_COUNTRY_SOURCE", os.path.join(GAZETTEER_DIR, "fixtures", "geonames_countries_sample.txt")
+)
+GAZETTEER_MIN_POPULATION = int(os.getenv("GAZETTEER_MIN_POPULATION", "0"))
+# Score bonus for the most populous cities (scaled by log10 population)
+GAZETTEER_POPULATION_WEIGHT = float(os.getenv("GAZETTEER_POPULATION_WEIGHT", "0.5"))
+
+def read_geonames_names(path: Optional[str], key_col: int, name_col: int) -> Dict[str, str]:
+    """code -> name from a GeoNames lookup file (admin1CodesASCII.txt, countryInfo.txt)"""
+    names = {}
+    if not path or not os.path.exists(path):
+        return names
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) > max(key_col, name_col):
+                names[cols[key_col]] = cols[name_col]
+    return names
+
+def parse_geonames(path: str, admin1_path: Optional[str] = None, country_path: Optional[str] = None,
+                   min_population: int = 0):
+    """Yield (name, ascii_name, lat, lon, population, country, region) from a GeoNames cities file"""
+    admin1 = read_geonames_names(admin1_path, 0, 1)
+    countries = read_geonames_names(country_path, 0, 4)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15:
+                continue
+            population = int(cols[14] or 0)
+            if population < min_population:
+                continue
+            code = cols[8]
+            yield (
+                cols[1], cols[2], float(cols[4]), float(cols[5]), population,
+                f"{code}|{countries.get(code, code)}", admin1.get(f"{code}.{cols[10]}", "")
+            )
+
+class Gazetteer:
+    """Read-only city table in a compact binary file, memory-mapped on open.
+
+    Layout: magic, uint32 header length, JSON header (count, string tables, column offsets),
+    then 8-byte aligned little-endian columns and a UTF-8 name blob.
+    """
+    MAGIC = b"WWGAZ001"
+    COLUMNS = (
+        ("lat", "<f4"), ("lon", "<f4"), ("population", "<u4"), ("country", "<u2"), ("region", "<u2"),
+        ("name_offset", "<u4"), ("name_length", "<u2"), ("ascii_offset", "<u4"), ("ascii_length", "<u2"),
+    )
+
+    @classmethod
+    def write(cls, path: str, records) -> int:
+        """Compile (name, ascii_name, lat, lon, population, country, region) records; returns the count"""
+        countries, regions = StringTable(), StringTable()
+        columns = {name: [] for name, _ in cls.COLUMNS}
+        blob = bytearray()
+        for name, ascii_name, lat, lon, population, country, region in records:
+            encoded = name.encode("utf-8")
+            columns["lat"].append(lat)
+            columns["lon"].append(lon)
+            columns["population"].append(min(population, 2**32 - 1))
+            columns["country"].append(countries.intern(country))
+            columns["region"].append(regions.intern(region))
+            columns["name_offset"].append(len(blob))
+            columns["name_length"].append(len(encoded))
+            blob += encoded
+            if ascii_name and ascii_name != name:
+                encoded = ascii_name.encode("utf-8")
+                columns["ascii_offset"].append(len(blob))
+                columns["ascii_length"].append(len(encoded))
+                blob += encoded
+            else:
+                columns["ascii_offset"].append(0)
+                columns["ascii_length"].append(0)
+
+        count = len(columns["lat"])
+        arrays = [(name, np.asarray(columns[name], dtype=dtype)) for name, dtype in cls.COLUMNS]
+        header = {"count": count, "countries": countries.values, "regions": regions.values, "offsets": {}}
+        # Offsets depend on the header length, so size the header with placeholder offsets first
+        for name, _ in arrays:
+            header["offsets"][name] = 0
+        header["offsets"]["names"] = 0
+        header_len = len(json.dumps(header).encode("utf-8")) + 16 * (len(arrays) + 1)
+        position = len(cls.MAGIC) + 4 + header_len
+        for name, values in arrays:
+            position += -position % 8
+            header["offsets"][name] = position
+            position += values.nbytes
+        header["offsets"]["names"] = position
+        header_bytes = json.dumps(header).encode("utf-8").ljust(header_len)
+
+        # A unique temp file per writer, so concurrent workers never truncate each other's output
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                        prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(cls.MAGIC + struct.pack("<I", header_len) + header_bytes)
+                for name, values in arrays:
+                    f.write(b"\0" * (header["offsets"][name] - f.tell()))
+                    f.write(values.tobytes())
+                f.write(bytes(blob))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return count
+
+    def __init__(self, path: str, population_weight: float = GAZETTEER_POPULATION_WEIGHT):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError(f"{path} is not a gazetteer file")
+        (header_len,) = struct.unpack_from("<I", self._mmap, len(self.MAGIC))
+        start = len(self.MAGIC) + 4
+        header = json.loads(self._mmap[start:start + header_len])
+        self.count = header["count"]
+        self.countries = [value.split("|", 1) for value in header["countries"]]  # [code, name]
+        self.regions = header["regions"]
+        for name, dtype in self.COLUMNS:
+            setattr(self, name, np.frombuffer(self._mmap, dtype=dtype, count=self.count,
+                                              offset=header["offsets"][name]))
+        self._names_offset = header["offsets"]["names"]
+        self.index = self._build_index(population_weight)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _text(self, offset: int, length: int) -> str:
+        start = self._names_offset + int(offset)
+        return self._mmap[start:start + int(length)].decode("utf-8")
+
+    def name(self, i: int) -> str:
+        return self._text(self.name_offset[i], self.name_length[i])
+
+    def _build_index(self, population_weight: float) -> TextIndex:
+        index = TextIndex()
+        popularity = np.minimum(np.log10(self.population.astype(np.float64) + 1.0) / 7.0, 1.0) * population_weight
+        for i in range(self.count):
+            fields = [(self.name(i), 1.0)]
+            if self.ascii_length[i]:
+                fields.append((self._text(self.ascii_offset[i], self.ascii_length[i]), 0.9))
+            fields.append((self.regions[self.region[i]], 0.6))
+            fields.append((self.countries[self.country[i]][1], 0.5))
+            index.add(i, fields, weight=float(popularity[i]))
+        index.prepare()
+        return index
+
+    def record(self, i: int) -> dict:
+        """One city shaped like a GLOBAL_LOCATIONS entry"""
+        code, country = self.countries[self.country[i]]
+        return {
+            "name": self.name(i),
+            "lat": round(float(self.lat[i]), 4),
+            "lon": round(float(self.lon[i]), 4),
+            "country": country,
+            "emoji": get_country_emoji(code),
+            "region": self.regions[self.region[i]],
+            "population": int(self.population[i])
+        }
+
+    def search(self, query: str, limit: int = 15) -> List[Tuple[dict, float]]:
+        return [(self.record(i), score) for i, score in self.index.search(query, limit)]
+
+    def memory_usage(self) -> dict:
+        return {"file_bytes": len(self._mmap), "index_bytes": self.index.memory_bytes()}
+
+gazetteer: Optional[Gazetteer] = None
+
+def load_gazetteer() -> Optional[Gazetteer]:
+    """Open the compiled gazetteer, rebuilding it from GAZETTEER_SOURCE when missing or stale"""
+    if not GAZETTEER_PATH:
+        return None
+    source = GAZETTEER_SOURCE if GAZETTEER_SOURCE and os.path.exists(GAZETTEER_SOURCE) else None
+
+    def stale() -> bool:
+        return not os.path.exists(GAZETTEER_PATH) or os.path.getmtime(GAZETTEER_PATH) < os.path.getmtime(source)
+
+    if source and stale():
+        with open(f"{GAZETTEER_PATH}.lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)  # Released when the file closes
+            # Another worker may have compiled it while we waited for the lock
+            if stale():
+                count = Gazetteer.write(GAZETTEER_PATH, parse_geonames(
+                    source, GAZETTEER_ADMIN1_SOURCE, GAZETTEER_COUNTRY_SOURCE, GAZETTEER_MIN_POPULATION
+                ))
+                print(f"Compiled gazetteer with {count} cities from {source}")
+    if not os.path.exists(GAZETTEER_PATH):
+        return None
+    return Gazetteer(GAZETTEER_PATH)
+
+async def start_gazetteer() -> asyncio.Task:
+    """Load the offline gazetteer in the background; location search uses the curated
+    list alone until it is ready"""
+    async def load():
+        global gazetteer
+        started = time.perf_counter()
+        try:
+            loaded = await asyncio.to_thread(load_gazetteer)
+        except Exception as e:
+            print(f"Error loading gazetteer: {e}")
+            return
+        if loaded is not None:
+            gazetteer = loaded
+            # Autocomplete sets cached meanwhile lack the gazetteer's cities
+            response_cache.clear_namespace("autocomplete")
+            print(f"Loaded gazetteer with {len(loaded)} cities in {time.perf_counter() - started:.2f}s")
+
+    return asyncio.create_task(load())
+
 # Global search engine instance
 search_engine = ActivitySearchEngine()
+place_db = PlaceDatabase(PLACES_DB_PATH) if PLACES_DB_PATH else None
+if place_db is not None:
+    search_engine.attach_database(place_db)
 
 # Pre-load with some common places (you can expand this)
 def initialize_common_places():
     """Initialize with some common places for faster results"""
     common_places = [
-        ActivityPlace("Marina Beach", 13.0500, 80.2820, "beach", "Chennai, Tamil Nadu", "beach"),
-        ActivityPlace("Kovalam Beach", 8.4000, 76.9786, "beach", "Kovalam, Kerala", "beach"),
-        ActivityPlace("Varkala Beach", 8.7376, 76.7066, "beach", "Varkala, Kerala", "beach"),
-        ActivityPlace("Bekal Beach", 12.3949, 75.0313, "beach", "Bekal, Kerala", "beach"),
-        ActivityPlace("Cherai Beach", 10.1418, 76.1792, "beach", "Cherai, Kerala", "beach"),
+        ActivityPlace("Marina Beach", 13.0500, 80.2820, "beach", "Chennai, Tamil Nadu", "beach", "seed"),
+        ActivityPlace("Kovalam Beach", 8.4000, 76.9786, "beach", "Kovalam, Kerala", "beach", "seed"),
+        ActivityPlace("Varkala Beach", 8.7376, 76.7066, "beach", "Varkala, Kerala", "beach", "seed"),
+        ActivityPlace("Bekal Beach", 12.3949, 75.0313, "beach", "Bekal, Kerala", "beach", "seed"),
+        ActivityPlace("Cherai Beach", 10.1418, 76.1792, "beach", "Cherai, Kerala", "beach", "seed"),
         
-        ActivityPlace("Munnar Hiking Trail", 10.0889, 77.0595, "hiking", "Munnar, Kerala", "hiking"),
-        ActivityPlace("Thekkady Nature Walk", 9.6000, 77.1667, "hiking", "Thekkady, Kerala", "hiking"),
-        ActivityPlace("Wayanad Hiking Trail", 11.6854, 76.1320, "hiking", "Wayanad, Kerala", "hiking"),
-        ActivityPlace("Athirapally Trail", 10.2856, 76.5701, "hiking", "Athirapally, Kerala", "hiking"),
+        ActivityPlace("Munnar Hiking Trail", 10.0889, 77.0595, "hiking", "Munnar, Kerala", "hiking", "seed"),
+        ActivityPlace("Thekkady Nature Walk", 9.6000, 77.1667, "hiking", "Thekkady, Kerala", "hiking", "seed"),
+        ActivityPlace("Wayanad Hiking Trail", 11.6854, 76.1320, "hiking", "Wayanad, Kerala", "hiking", "seed"),
+        ActivityPlace("Athirapally Trail", 10.2856, 76.5701, "hiking", "Athirapally, Kerala", "hiking", "seed"),
         
-        ActivityPlace("Wayanad Camping", 11.6854, 76.1320, "camping", "Wayanad, Kerala", "camping"),
-        ActivityPlace("Munnar Camp Site", 10.0889, 77.0595, "camping", "Munnar, Kerala", "camping"),
-        ActivityPlace("Thekkady Camping", 9.6000, 77.1667, "camping", "Thekkady, Kerala", "camping"),
+        ActivityPlace("Wayanad Camping", 11.6854, 76.1320, "camping", "Wayanad, Kerala", "camping", "seed"),
+        ActivityPlace("Munnar Camp Site", 10.0889, 77.0595, "camping", "Munnar, Kerala", "camping", "seed"),
+        ActivityPlace("Thekkady Camping", 9.6000, 77.1667, "camping", "Thekkady, Kerala", "camping", "seed"),
         
-        ActivityPlace("Kanakakkunnu Palace", 8.5241, 76.9366, "picnic", "Thiruvananthapuram, Kerala", "picnic"),
-        ActivityPlace("Veli Tourist Village", 8.4589, 76.9756, "picnic", "Thiruvananthapuram, Kerala", "picnic"),
-        ActivityPlace("Malampuzha Garden", 10.8322, 76.6916, "picnic", "Palakkad, Kerala", "picnic"),
+        ActivityPlace("Kanakakkunnu Palace", 8.5241, 76.9366, "picnic", "Thiruvananthapuram, Kerala", "picnic", "seed"),
+        ActivityPlace("Veli Tourist Village", 8.4589, 76.9756, "picnic", "Thiruvananthapuram, Kerala", "picnic", "seed"),
+        ActivityPlace("Malampuzha Garden", 10.8322, 76.6916, "picnic", "Palakkad, Kerala", "picnic", "seed"),
         
-        ActivityPlace("Jawaharlal Nehru Stadium", 8.5241, 76.9366, "sports", "Thiruvananthapuram, Kerala", "sports"),
-        ActivityPlace("University Stadium", 8.5465, 76.8795, "sports", "Thiruvananthapuram, Kerala", "sports"),
+        ActivityPlace("Jawaharlal Nehru Stadium", 8.5241, 76.9366, "sports", "Thiruvananthapuram, Kerala", "sports", "seed"),
+        ActivityPlace("University Stadium", 8.5465, 76.8795, "sports", "Thiruvananthapuram, Kerala", "sports", "seed"),
         
-        ActivityPlace("Ponmudi Viewpoint", 8.7590, 77.1129, "photo", "Ponmudi, Kerala", "photo"),
-        ActivityPlace("Athirapally Waterfall", 10.2856, 76.5701, "photo", "Athirapally, Kerala", "photo"),
-        ActivityPlace("Mattupetty Dam", 10.1000, 77.1167, "photo", "Munnar, Kerala", "photo"),
+        ActivityPlace("Ponmudi Viewpoint", 8.7590, 77.1129, "photo", "Ponmudi, Kerala", "photo", "seed"),
+        ActivityPlace("Athirapally Waterfall", 10.2856, 76.5701, "photo", "Athirapally, Kerala", "photo", "seed"),
+        ActivityPlace("Mattupetty Dam", 10.1000, 77.1167, "photo", "Munnar, Kerala", "photo", "seed"),
     ]
     
-    for place in common_places:
-        search_engine.add_place(place)
+    search_engine.add_places(common_places)
 
 # Initialize on startup
 initialize_common_places()
 
+async def start_place_persistence() -> Optional[asyncio.Task]:
+    """Warm-start from the place database and start the write-behind flusher"""
+    if place_db is None:
+        return None
+    if PLACES_DB_PRELOAD == "eager":
+        started = time.perf_counter()
+        loaded = await asyncio.to_thread(search_engine.load_all_from_database)
+        print(f"Loaded {loaded} stored places in {time.perf_counter() - started:.2f}s")
+
+    async def flush_periodically():
+        while True:
+            await asyncio.sleep(PLACES_DB_FLUSH_INTERVAL)
+            try:
+                await asyncio.to_thread(place_db.flush)
+            except Exception as e:
+                print(f"Error flushing places to database: {e}")
+
+    return asyncio.create_task(flush_periodically())
+
+async def stop_place_persistence(task: Optional[asyncio.Task]):
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    if place_db is not None:
+        await asyncio.to_thread(place_db.close)
+
 # Response cache for API calls
-response_cache = {}
-CACHE_DURATION = 300  # 5 minutes
+CACHE_DURATION = 300  # Default TTL, 5 minutes
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+# Per-endpoint TTLs in seconds
+CACHE_TTLS = {
+    "weather": int(os.getenv("CACHE_TTL_WEATHER", "600")),  # 10 minutes
+    "geocoding": int(os.getenv("CACHE_TTL_GEOCODING", "86400")),  # 24 hours
+    "nominatim": int(os.getenv("CACHE_TTL_NOMINATIM", "86400")),  # 24 hours
+    "places_area": int(os.getenv("CACHE_TTL_PLACES_AREA", "21600")),  # 6 hours
+    "autocomplete": int(os.getenv("CACHE_TTL_AUTOCOMPLETE", "3600")),  # 1 hour
+    "best_windows": int(os.getenv("CACHE_TTL_BEST_WINDOWS", "600")),  # 10 minutes, like the forecast
+}
 
-def get_cache_key(*args):
-    return hash(tuple(args))
+# Generated AI advice is cached separately so chatty weather lookups can't evict it.
+# Inputs are quantized to these bucket widths (0 = exact match) before keying, so
+# 84.1°F and 84.3°F at the same beach share one completion.
+ADVICE_CACHE_TTL = int(os.getenv("ADVICE_CACHE_TTL", "1800"))  # 30 minutes
+ADVICE_CACHE_MAX_ENTRIES = int(os.getenv("ADVICE_CACHE_MAX_ENTRIES", "2000"))
+ADVICE_BUCKETS = {
+    "temperature": float(os.getenv("ADVICE_BUCKET_TEMPERATURE", "2")),  # °F
+    "wind": float(os.getenv("ADVICE_BUCKET_WIND", "3")),  # mph
+    "precipitation": float(os.getenv("ADVICE_BUCKET_PRECIPITATION", "0.05")),  # inches
+    "precipitation_chance": float(os.getenv("ADVICE_BUCKET_PRECIPITATION_CHANCE", "10")),  # %
+    "humidity": float(os.getenv("ADVICE_BUCKET_HUMIDITY", "10")),  # %
+    "uv": float(os.getenv("ADVICE_BUCKET_UV", "1")),
+}
+ADVICE_CACHE_TTLS = {"analyze": ADVICE_CACHE_TTL, "forecast_insights": ADVICE_CACHE_TTL}
 
-def cached_api_call(func):
-    async def wrapper(*args, **kwargs):
-        cache_key = get_cache_key(func.__name__, args, tuple(kwargs.items()))
-        current_time = time.time()
-        
-        if cache_key in response_cache:
-            data, timestamp = response_cache[cache_key]
-            if current_time - timestamp < CACHE_DURATION:
-                print(f"Using cached response for {func.__name__}")
-                return data
-        
-        # Call the actual function
-        result = await func(*args, **kwargs)
-        response_cache[cache_key] = (result, current_time)
-        return result
-    return wrapper
+_MISSING = object()
+
+class TTLCache:
+    """Bounded LRU cache with per-entry expiry and hit/miss/eviction counters"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttls: Optional[Dict[str, int]] = None):
+        self.max_entries = max_entries
+        self.ttls = CACHE_TTLS if ttls is None else ttls
+        # (namespace, key) -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, object]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.namespace_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, namespace: str, key: str):
+        """Return the cached value or _MISSING, refreshing its LRU position"""
+        entry = self._entries.get((namespace, key))
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end((namespace, key))
+                self.hits += 1
+                self.namespace_stats[namespace]["hits"] += 1
+                return value
+            del self._entries[(namespace, key)]
+            self.expirations += 1
+        self.misses += 1
+        self.namespace_stats[namespace]["misses"] += 1
+        return _MISSING
+
+    def peek(self, namespace: str, key: str):
+        """Return the cached value or _MISSING without touching the counters or LRU order"""
+        entry = self._entries.get((namespace, key))
+        if entry is None or entry[0] <= time.monotonic():
+            return _MISSING
+        return entry[1]
+
+    def set(self, namespace: str, key: str, value, ttl: float):
+        """Store a value, evicting expired and then least recently used entries when full"""
+        self._entries[(namespace, key)] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end((namespace, key))
+        if len(self._entries) > self.max_entries:
+            self.purge_expired()
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def purge_expired(self) -> int:
+        """Drop all expired entries"""
+        now = time.monotonic()
+        expired = [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]
+        for k in expired:
+            del self._entries[k]
+        self.expirations += len(expired)
+        return len(expired)
+
+    def clear(self) -> int:
+        size = len(self._entries)
+        self._entries.clear()
+        return size
+
+    def clear_namespace(self, namespace: str) -> int:
+        stale = [k for k in self._entries if k[0] == namespace]
+        for k in stale:
+            del self._entries[k]
+        return len(stale)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "ttls": self.ttls,
+            "namespaces": dict(self.namespace_stats),
+        }
+
+response_cache = TTLCache()
+advice_cache = TTLCache(ADVICE_CACHE_MAX_ENTRIES, ttls=ADVICE_CACHE_TTLS)
+
+def get_cache_key(*args, **kwargs) -> str:
+    """Stable string key for call arguments (unlike hash(), works for lists/dicts)"""
+    return json.dumps([args, kwargs], sort_keys=True, default=str, separators=(",", ":"))
+
+def cached_api_call(namespace: str, ttl: Optional[float] = None, key_fn=None, cache_empty: bool = False,
+                    cache: Optional[TTLCache] = None):
+    """Cache an async upstream fetcher's results under a namespace (response_cache by default).
+
+    Empty results (failed lookups) are not cached unless cache_empty is set.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            store = response_cache if cache is None else cache
+            cache_key = key_fn(*args, **kwargs) if key_fn else get_cache_key(*args, **kwargs)
+            data = store.get(namespace, cache_key)
+            if data is not _MISSING:
+                print(f"Using cached response for {func.__name__}")
+                return data
+
+            # Call the actual function
+            result = await func(*args, **kwargs)
+            if result or cache_empty:
+                store.set(namespace, cache_key, result, ttl or store.ttls.get(namespace, CACHE_DURATION))
+            return result
+        return wrapper
+    return decorator
+
+def normalize_query_key(query: str) -> str:
+    """Cache key for free-text lookups: case and surrounding whitespace don't matter"""
+    return " ".join(query.lower().split())
+
+class SingleFlight:
+    """Coalesces concurrent identical upstream calls onto one in-flight task"""
+
+    def __init__(self):
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.originated: Dict[str, int] = defaultdict(int)
+        self.coalesced: Dict[str, int] = defaultdict(int)
+
+    async def do(self, namespace: str, key: str, coro_factory):
+        """Run coro_factory() once per key; concurrent callers await the same result"""
+        # Shield so one caller disconnecting doesn't cancel the fetch for everyone else
+        return await asyncio.shield(self.start(namespace, key, coro_factory))
+
+    def start(self, namespace: str, key: str, coro_factory) -> asyncio.Task:
+        """Join the in-flight task for a key, or start one, without waiting on it"""
+        flight_key = (namespace, key)
+        task = self._inflight.get(flight_key)
+        if task is None:
+            task = asyncio.ensure_future(coro_factory())
+            self._inflight[flight_key] = task
+            task.add_done_callback(lambda t: self._finish(flight_key, t))
+            self.originated[namespace] += 1
+        else:
+            self.coalesced[namespace] += 1
+        return task
+
+    def _finish(self, flight_key: Tuple[str, str], task: asyncio.Task):
+        if self._inflight.get(flight_key) is task:
+            del self._inflight[flight_key]
+        if not task.cancelled():
+            task.exception()  # Mark retrieved even if every waiter went away
+
+    def in_flight(self, namespace: str, key: str) -> bool:
+        return (namespace, key) in self._inflight
+
+    def stats(self) -> dict:
+        namespaces = set(self.originated) | set(self.coalesced)
+        return {
+            "in_flight": len(self._inflight),
+            "originated": sum(self.originated.values()),
+            "coalesced": sum(self.coalesced.values()),
+            "namespaces": {
+                ns: {"originated": self.originated[ns], "coalesced": self.coalesced[ns]}
+                for ns in sorted(namespaces)
+            },
+        }
+
+upstream_flights = SingleFlight()
+
+def single_flight(namespace: str, key_fn=None):
+    """Coalesce concurrent calls with the same normalized key into one upstream request"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            flight_key = key_fn(*args, **kwargs) if key_fn else get_cache_key(*args, **kwargs)
+            return await upstream_flights.do(namespace, flight_key, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
+
+def external_places_key(lat: float, lon: float, activity: str, location_name: str) -> str:
+    return f"{lat:.3f},{lon:.3f}|{activity.lower()}|{normalize_query_key(location_name)}"
 
 @app.post("/api/location/search")
 async def search_location(request: LocationSearchRequest):
@@ -450,165 +1937,310 @@ async def search_location(request: LocationSearchRequest):
         if not query or len(query.strip()) < 2:
             return {"locations": []}
         
-        # First try local search from predefined locations (FAST)
-        local_results = await search_local_locations(query)
-        if local_results:
-            print(f"Found {len(local_results)} local results for '{query}'")
-            return {"locations": local_results}
-        
-        # If no local results, try external APIs
-        external_results = await search_external_apis(query)
-        return {"locations": external_results}
+        locations, source = await resolve_locations(query)
+        if source != "external":
+            print(f"Found {len(locations)} {source} results for '{query}'")
+        return {"locations": locations}
         
     except Exception as e:
         print(f"Error in location search: {e}")
         # Return empty results instead of error
         return {"locations": []}
 
-async def search_local_locations(query: str) -> List[dict]:
-    """Fast local search from predefined locations"""
+def local_location_matches(query: str, limit: int = 15) -> Tuple[List[dict], bool]:
+    """Curated and gazetteer matches for a query, and whether any source had more than limit"""
     if not query or len(query) < 2:
-        return []
-    
-    query_lower = query.lower().strip()
-    results = []
+        return [], False
     
-    # Search in predefined global locations
-    for loc in GLOBAL_LOCATIONS:
-        name_match = query_lower in loc["name"].lower()
-        country_match = query_lower in loc["country"].lower() 
-        region_match = query_lower in loc.get("region", "").lower()
-        
-        if name_match or country_match or region_match:
-            results.append(loc)
-    
-    # Sort by relevance (exact matches first, then partial matches)
-    results.sort(key=lambda x: (
-        not x["name"].lower().startswith(query_lower),  # Exact matches first
-        not x["name"].lower().replace(' ', '').startswith(query_lower.replace(' ', '')),  # Close matches
-        len(x["name"])  # Shorter names first (usually more relevant)
-    ))
-    
-    return results[:15]  # Limit results
+    # Ranked prefix / token / typo-tolerant lookup over names, regions and countries.
+    # Curated locations rank like major cities and win over their gazetteer duplicates.
+    curated_hits = location_index.search(query, limit=limit)
+    curated = [(GLOBAL_LOCATIONS[i], score + GAZETTEER_POPULATION_WEIGHT) for i, score in curated_hits]
+    truncated = len(curated_hits) >= limit
+    if gazetteer is None:
+        return [loc for loc, _ in curated], truncated
+    cities = gazetteer.search(query, limit=limit)
+    ranked = dedupe_city_dicts(
+        [loc for loc, _ in sorted(curated + cities, key=lambda r: -r[1])],
+        radius_km=25.0
+    )
+    return ranked[:limit], truncated or len(cities) >= limit or len(ranked) > limit
 
-async def search_external_apis(query: str) -> List[dict]:
-    """Search external geocoding APIs"""
-    locations = []
+async def search_local_locations(query: str, limit: int = 15) -> List[dict]:
+    """Fast local search from predefined locations"""
+    return local_location_matches(query, limit)[0]
+
+async def resolve_locations(query: str, limit: int = 15) -> Tuple[List[dict], str]:
+    """Local locations, then indexed places, then external geocoders; returns (locations, source)"""
+    # First try local search from predefined locations and the gazetteer (FAST)
+    local_results = await search_local_locations(query, limit)
+    if local_results:
+        return local_results, "local"
+    return await resolve_fallback_locations(query, limit)
+
+async def resolve_fallback_locations(query: str, limit: int = 15) -> Tuple[List[dict], str]:
+    """resolve_locations past the local step, for queries with no local location match"""
+    # Places we have indexed (beaches, trails, ...) by name
+    place_results = search_local_place_names(query, min(limit, 10))
+    if place_results:
+        return place_results, "places"
     
+    # If no local results, try external APIs
+    return await search_external_apis(query), "external"
+
+# Autocomplete keeps up to AUTOCOMPLETE_CANDIDATES matches per prefix so longer prefixes can be
+# answered by filtering a shorter prefix's cached set instead of searching again
+AUTOCOMPLETE_CANDIDATES = 100
+AUTOCOMPLETE_MAX_AGE = int(os.getenv("AUTOCOMPLETE_MAX_AGE", "300"))  # browser/CDN cache, seconds
+AUTOCOMPLETE_DISCONNECT_POLL = 0.05  # seconds
+autocomplete_stats: Dict[str, int] = defaultdict(int)
+
+def location_matches_tokens(location: dict, query_tokens: List[str]) -> bool:
+    """Every query token matches a token of the location's name, region or country by
+    TextIndex's rules (prefix, or infix for longer tokens)"""
+    text = " ".join(filter(None, (location.get("name"), location.get("region") or location.get("state"),
+                                  location.get("country"))))
+    tokens = normalize_place_name(text).split()
+    return all(any(TextIndex.token_matches_text(q, t) for t in tokens) for q in query_tokens)
+
+def narrowing_is_exact(parent_key: str, query_tokens: List[str]) -> bool:
+    """Whether the full search for query_tokens can only return locations in parent_key's set.
+
+    Each extended token must match no more than its parent token did: the parent
+    matched infixes too, or the longer token still only matches prefixes. Typo
+    matches can't be checked against the cached set, so a token some index would
+    only match by edit distance needs the full search.
+    """
+    parent_tokens = parent_key.split()
+    for parent, token in zip(parent_tokens, query_tokens):
+        if len(parent) < TextIndex.INFIX_MIN_LENGTH <= len(token):
+            return False
+    indexes = [location_index] + ([gazetteer.index] if gazetteer is not None else [])
+    return not any(index.matches_only_by_typo(token) for token in query_tokens for index in indexes)
+
+def narrow_autocomplete(key: str) -> Optional[Tuple[List[dict], str]]:
+    """Answer from the cache: this exact prefix, or a filtered complete set of a shorter one"""
+    cached = response_cache.get("autocomplete", key)
+    if cached is not _MISSING:
+        return cached["locations"], "cache"
+    query_tokens = key.split()
+    for end in range(len(key) - 1, 1, -1):
+        parent_key = key[:end].rstrip()
+        parent = response_cache.peek("autocomplete", parent_key)
+        if parent is _MISSING:
+            continue
+        if not parent["complete"] or not narrowing_is_exact(parent_key, query_tokens):
+            return None
+        narrowed = [loc for loc in parent["locations"] if location_matches_tokens(loc, query_tokens)]
+        if not narrowed:
+            return None  # Let a full search try typo-tolerant and external matches
+        # Names that start with the query first, otherwise keep the parent's ranking
+        narrowed.sort(key=lambda loc: not normalize_place_name(loc["name"]).startswith(key))
+        response_cache.set("autocomplete", key, {"locations": narrowed, "complete": True},
+                           CACHE_TTLS["autocomplete"])
+        return narrowed, "narrowed"
+    return None
+
+async def autocomplete_lookup(key: str) -> Tuple[List[dict], str]:
+    locations, truncated = local_location_matches(key, AUTOCOMPLETE_CANDIDATES)
+    # A local result set no source truncated holds every match, so longer prefixes can filter it
+    complete = bool(locations) and not truncated
+    if locations:
+        source = "local"
+    else:
+        locations, source = await resolve_fallback_locations(key, AUTOCOMPLETE_CANDIDATES)
+    if locations:
+        response_cache.set("autocomplete", key, {"locations": locations, "complete": complete},
+                           CACHE_TTLS["autocomplete"])
+    return locations, source
+
+async def cancel_on_disconnect(request: Request, coro):
+    """Await coro, cancelling it if the client goes away first; returns None when cancelled"""
+    task = asyncio.ensure_future(coro)
     try:
-        # Try Open-Meteo Geocoding first
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                GEOCODING_API_URL,
-                params={
-                    "name": query,
-                    "count": 10,
-                    "language": "en",
-                    "format": "json"
-                },
-                timeout=5.0  # Shorter timeout
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if "results" in data:
-                    for loc in data["results"]:
-                        country_code = loc.get("country_code", "").upper()
-                        emoji = get_country_emoji(country_code)
-                        
-                        locations.append({
-                            "name": loc.get("name", "Unknown"),
-                            "country": loc.get("country", "Unknown"),
-                            "state": loc.get("admin1", ""),
-                            "lat": loc.get("latitude", 0),
-                            "lon": loc.get("longitude", 0),
-                            "emoji": emoji
-                        })
-    except Exception as e:
-        print(f"Open-Meteo API error: {e}")
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=AUTOCOMPLETE_DISCONNECT_POLL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+@app.get("/api/location/autocomplete")
+async def autocomplete_locations(request: Request, q: str = "", limit: int = 8):
+    """Prefix location search for type-ahead, answered from cached shorter prefixes when possible"""
+    key = normalize_place_name(q)
+    if len(key) < 2:
+        return JSONResponse({"query": q, "locations": [], "source": "none"})
+    limit = max(1, min(limit, 20))
     
-    # If no results from Open-Meteo, try Nominatim
-    if not locations:
-        try:
-            nominatim_results = await search_nominatim(query)
-            locations.extend(nominatim_results)
-        except Exception as e:
-            print(f"Nominatim API error: {e}")
+    result = narrow_autocomplete(key)
+    if result is None:
+        result = await cancel_on_disconnect(request, autocomplete_lookup(key))
+        if result is None:
+            autocomplete_stats["cancelled"] += 1
+            return Response(status_code=499)  # Client closed request
+    locations, source = result
+    autocomplete_stats[source] += 1
     
-    return locations
+    body = json.dumps({"query": q, "locations": locations[:limit], "source": source}).encode("utf-8")
+    headers = {
+        "Cache-Control": f"public, max-age={AUTOCOMPLETE_MAX_AGE}, stale-while-revalidate={AUTOCOMPLETE_MAX_AGE}",
+        "ETag": f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        autocomplete_stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
-async def search_local_locations(query: str) -> List[dict]:
-    """Fast local search from predefined locations"""
-    if not query or len(query) < 2:
+def search_local_place_names(query: str, limit: int = 10) -> List[dict]:
+    """Indexed activity places matching the query, shaped like location results"""
+    if len(query.strip()) < 3:
         return []
-    
-    query_lower = query.lower().strip()
-    results = []
-    
-    # Search in predefined global locations
-    for loc in GLOBAL_LOCATIONS:
-        name_match = query_lower in loc["name"].lower()
-        country_match = query_lower in loc["country"].lower() 
-        region_match = query_lower in loc.get("region", "").lower()
-        
-        if name_match or country_match or region_match:
-            results.append(loc)
-    
-    # Sort by relevance (exact matches first, then partial matches)
-    results.sort(key=lambda x: (
-        not x["name"].lower().startswith(query_lower),  # Exact matches first
-        not x["name"].lower().replace(' ', '').startswith(query_lower.replace(' ', '')),  # Close matches
-        len(x["name"])  # Shorter names first (usually more relevant)
-    ))
-    
-    return results[:15]  # Limit results
+    return [{
+        "name": place.name,
+        "lat": place.lat,
+        "lon": place.lon,
+        "country": "",
+        "state": place.address,
+        "emoji": "📍"
+    } for place, _ in search_engine.search_names(query, limit)]
 
+@cached_api_call("geocoding", key_fn=normalize_query_key)
 async def search_external_apis(query: str) -> List[dict]:
-    """Search external geocoding APIs"""
+    """Search external geocoding APIs (Open-Meteo, then Nominatim, per GEOCODING_MODE)"""
+    if GEOCODING_MODE == "sequential":
+        locations = await timed_geocode("open_meteo", query)
+        if not locations:
+            locations = await timed_geocode("nominatim", query)
+        return locations
+    return await hedged_geocode(query, 0.0 if GEOCODING_MODE == "race" else GEOCODING_HEDGE_DELAY)
+
+async def hedged_geocode(query: str, hedge_delay: float) -> List[dict]:
+    """Query Open-Meteo, firing Nominatim too if it is slow or empty after hedge_delay.
+
+    The first non-empty answer wins. The other provider gets GEOCODING_MERGE_GRACE more
+    seconds to finish so both result sets can be merged, and is cancelled otherwise.
+    """
+    loop = asyncio.get_running_loop()
+    end_time = loop.time() + GEOCODING_DEADLINE
+    primary = asyncio.ensure_future(timed_geocode("open_meteo", query))
+    tasks = [primary]
+    try:
+        await asyncio.wait({primary}, timeout=hedge_delay)
+        if not (primary.done() and primary.result()):
+            tasks.append(asyncio.ensure_future(timed_geocode("nominatim", query)))
+            pending = {task for task in tasks if not task.done()}
+            winner = next((task for task in tasks if task.done() and task.result()), None)
+            while pending and winner is None:
+                remaining = end_time - loop.time()
+                if remaining <= 0:
+                    print(f"Geocoding deadline of {GEOCODING_DEADLINE}s reached for '{query}'")
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in tasks if task in done and task.result()), None)
+            if winner is not None and pending:
+                await asyncio.wait(pending, timeout=GEOCODING_MERGE_GRACE)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Primary provider's results first; drop the same place reported by both
+    merged = []
+    for task in tasks:
+        if not task.cancelled():
+            merged.extend(task.result())
+    return dedupe_city_dicts(merged, radius_km=10.0)
+
+async def search_open_meteo_geocoding(query: str) -> List[dict]:
+    """Search using the Open-Meteo geocoding API"""
     locations = []
     
     try:
-        # Try Open-Meteo Geocoding first
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                GEOCODING_API_URL,
-                params={
-                    "name": query,
-                    "count": 10,
-                    "language": "en",
-                    "format": "json"
-                },
-                timeout=5.0  # Shorter timeout
-            )
+        client = http_clients.get("geocoding")
+        response = await client.get(
+            GEOCODING_API_URL,
+            params={
+                "name": query,
+                "count": 10,
+                "language": "en",
+                "format": "json"
+            },
+            timeout=5.0  # Shorter timeout
+        )
             
-            if response.status_code == 200:
-                data = response.json()
-                if "results" in data:
-                    for loc in data["results"]:
-                        country_code = loc.get("country_code", "").upper()
-                        emoji = get_country_emoji(country_code)
-                        
-                        locations.append({
-                            "name": loc.get("name", "Unknown"),
-                            "country": loc.get("country", "Unknown"),
-                            "state": loc.get("admin1", ""),
-                            "lat": loc.get("latitude", 0),
-                            "lon": loc.get("longitude", 0),
-                            "emoji": emoji
-                        })
+        if response.status_code == 200:
+            data = response.json()
+            if "results" in data:
+                for loc in data["results"]:
+                    country_code = loc.get("country_code", "").upper()
+                    emoji = get_country_emoji(country_code)
+                    
+                    locations.append({
+                        "name": loc.get("name", "Unknown"),
+                        "country": loc.get("country", "Unknown"),
+                        "state": loc.get("admin1", ""),
+                        "lat": loc.get("latitude", 0),
+                        "lon": loc.get("longitude", 0),
+                        "emoji": emoji
+                    })
     except Exception as e:
         print(f"Open-Meteo API error: {e}")
     
-    # If no results from Open-Meteo, try Nominatim
-    if not locations:
-        try:
-            nominatim_results = await search_nominatim(query)
-            locations.extend(nominatim_results)
-        except Exception as e:
-            print(f"Nominatim API error: {e}")
-    
     return locations
 
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds) with per-outcome counts"""
+    BUCKETS_MS = (50, 100, 200, 400, 800, 1600, 3200, 6400)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.outcomes: Dict[str, int] = defaultdict(int)
+
+    def observe(self, seconds: float, outcome: str):
+        elapsed_ms = seconds * 1000.0
+        self.counts[bisect.bisect_left(self.BUCKETS_MS, elapsed_ms)] += 1
+        self.total_ms += elapsed_ms
+        self.outcomes[outcome] += 1
+
+    def stats(self) -> dict:
+        observed = sum(self.counts)
+        labels = [f"<={b}ms" for b in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        return {
+            "count": observed,
+            "mean_ms": round(self.total_ms / observed, 1) if observed else None,
+            "buckets": dict(zip(labels, self.counts)),
+            "outcomes": dict(self.outcomes)
+        }
+
+geocoding_latency: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+
+async def timed_geocode(provider: str, query: str) -> List[dict]:
+    """Run one geocoding provider, recording its latency and outcome"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        if provider == "open_meteo":
+            locations = await search_open_meteo_geocoding(query)
+        else:
+            locations = await search_nominatim(query)
+        outcome = "ok" if locations else "empty"
+        return locations
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        print(f"Geocoding provider {provider} failed: {e}")
+        return []
+    finally:
+        geocoding_latency[provider].observe(time.perf_counter() - started, outcome)
+
 @app.post("/api/debug/request-format")
 async def debug_request_format(request: dict):
     """Debug endpoint to see what data frontend is sending"""
@@ -622,46 +2254,48 @@ async def debug_request_format(request: dict):
         "message": "Check server console for request details"
     }
 
+@cached_api_call("nominatim", key_fn=normalize_query_key)
 async def search_nominatim(query: str):
     """Search using OpenStreetMap Nominatim API"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://nominatim.openstreetmap.org/search",
-                params={
-                    "q": query,
-                    "format": "json",
-                    "limit": 10,
-                    "addressdetails": 1
-                },
-                headers={"User-Agent": "WeatherWiseApp/1.0"},
-                timeout=8.0
-            )
+        await nominatim_limiter.acquire()
+        client = http_clients.get("nominatim")
+        response = await client.get(
+            NOMINATIM_URL,
+            params={
+                "q": query,
+                "format": "json",
+                "limit": 10,
+                "addressdetails": 1
+            },
+            headers=NOMINATIM_HEADERS,
+            timeout=8.0
+        )
             
-            if response.status_code == 200:
-                data = response.json()
-                locations = []
+        if response.status_code == 200:
+            data = response.json()
+            locations = []
+            
+            for loc in data:
+                address = loc.get("address", {})
+                country_code = address.get("country_code", "").upper()
+                emoji = get_country_emoji(country_code)
                 
-                for loc in data:
-                    address = loc.get("address", {})
-                    country_code = address.get("country_code", "").upper()
-                    emoji = get_country_emoji(country_code)
-                    
-                    # Create a more user-friendly display name
-                    display_name = loc.get("display_name", "")
-                    name_parts = display_name.split(",")
-                    primary_name = name_parts[0] if name_parts else "Unknown"
-                    
-                    locations.append({
-                        "name": primary_name,
-                        "country": address.get("country", "Unknown"),
-                        "state": address.get("state", ""),
-                        "lat": float(loc.get("lat")),
-                        "lon": float(loc.get("lon")),
-                        "emoji": emoji
-                    })
+                # Create a more user-friendly display name
+                display_name = loc.get("display_name", "")
+                name_parts = display_name.split(",")
+                primary_name = name_parts[0] if name_parts else "Unknown"
                 
-                return locations
+                locations.append({
+                    "name": primary_name,
+                    "country": address.get("country", "Unknown"),
+                    "state": address.get("state", ""),
+                    "lat": float(loc.get("lat")),
+                    "lon": float(loc.get("lon")),
+                    "emoji": emoji
+                })
+            
+            return locations
     except Exception as e:
         print(f"Error with Nominatim: {e}")
     
@@ -680,55 +2314,275 @@ def get_country_emoji(country_code: str) -> str:
     except:
         return "📍"
 
+class TokenBucket:
+    """Async token-bucket rate limiter shared by every caller of an upstream"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.waits = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available (waiters are served in FIFO order)"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                self.waits += 1
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+nominatim_limiter = TokenBucket(NOMINATIM_RATE_LIMIT, NOMINATIM_BURST)
+
+async def nominatim_get(params: dict, timeout: float) -> list:
+    """Rate-limited Nominatim search; returns [] on non-200 responses"""
+    await nominatim_limiter.acquire()
+    client = http_clients.get("nominatim")
+    response = await client.get(NOMINATIM_URL, params=params, headers=NOMINATIM_HEADERS, timeout=timeout)
+    if response.status_code != 200:
+        return []
+    return response.json()
+
+async def fan_out(job_factories: list, target: int, concurrency: int = PLACES_FANOUT_CONCURRENCY,
+                  deadline: float = PLACES_SEARCH_DEADLINE) -> list:
+    """Run list-returning jobs with bounded concurrency under a deadline.
+
+    Stops early once `target` items are collected and cancels the remaining
+    jobs. Results are concatenated in job order so earlier (more specific)
+    search terms keep their priority.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(factory):
+        async with semaphore:
+            return await factory()
+
+    tasks = [asyncio.ensure_future(run(factory)) for factory in job_factories]
+    loop = asyncio.get_running_loop()
+    end_time = loop.time() + deadline
+    pending = set(tasks)
+    collected = 0
+    try:
+        while pending and collected < target:
+            remaining = end_time - loop.time()
+            if remaining <= 0:
+                print(f"Fan-out deadline of {deadline}s reached with {len(pending)} jobs pending")
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    print(f"Fan-out job failed: {task.exception()}")
+                else:
+                    collected += len(task.result())
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    results = []
+    for task in tasks:
+        if task.done() and not task.cancelled() and task.exception() is None:
+            results.extend(task.result())
+    return results
+
+# OSM tag -> (activity type, values). First match wins, so more specific tags go first.
+OSM_ACTIVITY_TAGS = [
+    ("beach", "natural", ("beach",)),
+    ("beach", "leisure", ("beach_resort",)),
+    ("camping", "tourism", ("camp_site", "caravan_site")),
+    ("hiking", "route", ("hiking", "foot")),
+    ("hiking", "leisure", ("nature_reserve",)),
+    ("sports", "leisure", ("stadium", "sports_centre")),
+    ("picnic", "tourism", ("picnic_site",)),
+    ("picnic", "leisure", ("park", "garden", "picnic_table")),
+    ("photo", "tourism", ("viewpoint", "attraction")),
+    ("photo", "historic", ("monument", "castle", "fort")),
+    ("photo", "waterway", ("waterfall",)),
+]
+
+def classify_osm_tags(tags: dict) -> Optional[Tuple[str, str]]:
+    """Map OSM tags to (activity_type, place type), or None if not an activity place"""
+    for activity, key, values in OSM_ACTIVITY_TAGS:
+        value = tags.get(key)
+        if value in values:
+            return activity, value.replace("_", " ")
+    return None
+
+def osm_address(tags: dict) -> str:
+    parts = [tags.get(k) for k in ("addr:street", "addr:city", "addr:state", "addr:country")]
+    return ", ".join(p for p in parts if p)
+
+def parse_osm_elements(elements: list, source: str = "overpass") -> List[ActivityPlace]:
+    """Turn Overpass JSON elements into classified ActivityPlace records"""
+    places = []
+    seen = set()
+    for element in elements:
+        element_key = (element.get("type"), element.get("id"))
+        if element_key in seen:
+            continue  # Matched more than one tag clause, so it was output more than once
+        if element_key[1] is not None:
+            seen.add(element_key)
+        tags = element.get("tags", {})
+        name = tags.get("name")
+        classified = classify_osm_tags(tags)
+        if not name or not classified:
+            continue
+        point = element if "lat" in element else element.get("center")
+        if not point:
+            continue
+        activity, place_type = classified
+        places.append(ActivityPlace(
+            name=name,
+            lat=float(point["lat"]),
+            lon=float(point["lon"]),
+            type=place_type,
+            address=osm_address(tags),
+            activity_type=activity,
+            source=source
+        ))
+    return places
+
+def build_overpass_query(south: float, west: float, north: float, east: float, timeout: int = 25) -> str:
+    """One Overpass QL query covering every activity category in the bbox.
+
+    Each tag clause gets its own output limit, so dense parks and attractions
+    cannot crowd beaches or stadiums out of the response.
+    """
+    bbox = f"{south},{west},{north},{east}"
+    clauses = "".join(
+        f'nwr["{key}"~"^({"|".join(values)})$"]["name"]({bbox});out center tags {OVERPASS_CATEGORY_LIMIT};'
+        for _, key, values in OSM_ACTIVITY_TAGS
+    )
+    return f"[out:json][timeout:{timeout}];{clauses}"
+
+class PlaceProvider(ABC):
+    """Fetches all activity places inside a bounding box in a single round trip"""
+    name = "base"
+
+    @abstractmethod
+    async def fetch_places(self, south: float, west: float, north: float, east: float) -> List[ActivityPlace]:
+        ...
+
+class OverpassPlaceProvider(PlaceProvider):
+    """Structured OSM query via the Overpass API"""
+    name = "overpass"
+
+    def __init__(self, url: str = OVERPASS_URL):
+        self.url = url
+
+    async def fetch_places(self, south, west, north, east):
+        client = http_clients.get("overpass")
+        response = await client.post(
+            self.url,
+            data={"data": build_overpass_query(south, west, north, east)},
+            headers=NOMINATIM_HEADERS,
+            timeout=30.0
+        )
+        if response.status_code != 200:
+            print(f"Overpass API error: {response.status_code}")
+            return []
+        return parse_osm_elements(response.json().get("elements", []))
+
+class FixturePlaceProvider(PlaceProvider):
+    """Serves places from an Overpass-format JSON file instead of the live API, for
+    offline development and demos (PLACE_PROVIDER=fixture)"""
+    name = "fixture"
+
+    def __init__(self, path: str = PLACE_FIXTURE_PATH):
+        self.path = path
+        self._places: Optional[List[ActivityPlace]] = None
+
+    async def fetch_places(self, south, west, north, east):
+        if self._places is None:
+            with open(self.path, encoding="utf-8") as f:
+                self._places = parse_osm_elements(json.load(f).get("elements", []), source=self.name)
+        return [p for p in self._places if south <= p.lat <= north and west <= p.lon <= east]
+
+PLACE_PROVIDERS = {
+    "overpass": OverpassPlaceProvider,
+    "fixture": FixturePlaceProvider,
+}
+
+# None means the legacy per-term Nominatim search
+place_provider: Optional[PlaceProvider] = PLACE_PROVIDERS[PLACE_PROVIDER]() if PLACE_PROVIDER in PLACE_PROVIDERS else None
+
+def place_area_bbox(lat: float, lon: float) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) around the area center snapped to PLACE_AREA_SNAP_DEG"""
+    center_lat = round(lat / PLACE_AREA_SNAP_DEG) * PLACE_AREA_SNAP_DEG
+    center_lon = round(lon / PLACE_AREA_SNAP_DEG) * PLACE_AREA_SNAP_DEG
+    return (
+        round(center_lat - PLACE_AREA_RADIUS_DEG, 4), round(center_lon - PLACE_AREA_RADIUS_DEG, 4),
+        round(center_lat + PLACE_AREA_RADIUS_DEG, 4), round(center_lon + PLACE_AREA_RADIUS_DEG, 4),
+    )
+
+@cached_api_call("places_area")
+@single_flight("places_area")
+async def fetch_area_places(south: float, west: float, north: float, east: float) -> List[ActivityPlace]:
+    """All activity places for an area from the configured provider, indexed once per fetch.
+
+    Returns the canonical records the merge kept, so a place OSM maps as both
+    a node and a way (or another source already had) appears once.
+    """
+    places = await place_provider.fetch_places(south, west, north, east)
+    print(f"{place_provider.name} returned {len(places)} places for bbox {south},{west},{north},{east}")
+    place_ids = dict.fromkeys(search_engine.add_place(place) for place in places)
+    return [search_engine.get_place(place_id) for place_id in place_ids]
+
+async def find_provider_places(lat: float, lon: float, activity: str) -> List[ActivityPlace]:
+    """Places of one activity type near a point, nearest first"""
+    area_places = await fetch_area_places(*place_area_bbox(lat, lon))
+    matches = [p for p in area_places if p.activity_type == activity]
+    matches.sort(key=lambda p: search_engine._calculate_distance(lat, lon, p.lat, p.lon))
+    return matches[:PLACES_TARGET_RESULTS]
+
 @app.post("/api/activity/places")
 async def get_activity_places(request: ActivityPlacesRequest):
     """Get places for specific activities in a location"""
     try:
-        
-        places = []
+        if place_provider is not None:
+            found = await find_provider_places(request.lat, request.lon, request.activity)
+            return {"places": [{
+                "name": p.name,
+                "lat": p.lat,
+                "lon": p.lon,
+                "type": p.type,
+                "address": p.address
+            } for p in found]}
+
         queries = ACTIVITY_SEARCH_TERMS.get(request.activity, [request.activity])
+        viewbox = f"{request.lon-0.5},{request.lat-0.5},{request.lon+0.5},{request.lat+0.5}"
+
+        def make_job(query: str):
+            async def job() -> List[dict]:
+                # Search for places using OpenStreetMap Nominatim
+                data = await nominatim_get({
+                    "q": f"{query} in {request.locationName}",
+                    "format": "json",
+                    "limit": 10,
+                    "addressdetails": 1,
+                    "viewbox": viewbox,
+                    "bounded": 1
+                }, timeout=10.0)
+                return [{
+                    "name": place.get("display_name", "").split(",")[0],
+                    "lat": float(place.get("lat")),
+                    "lon": float(place.get("lon")),
+                    "type": query,
+                    "address": place.get("display_name", "")
+                } for place in data]
+            return job
+
+        places = await fan_out([make_job(query) for query in queries], target=PLACES_TARGET_RESULTS)
         
-        for query in queries:
-            try:
-                async with httpx.AsyncClient() as client:
-                    # Search for places using OpenStreetMap Nominatim
-                    search_query = f"{query} in {request.locationName}"
-                    response = await client.get(
-                        "https://nominatim.openstreetmap.org/search",
-                        params={
-                            "q": search_query,
-                            "format": "json",
-                            "limit": 10,
-                            "addressdetails": 1,
-                            "viewbox": f"{request.lon-0.5},{request.lat-0.5},{request.lon+0.5},{request.lat+0.5}",
-                            "bounded": 1
-                        },
-                        headers={"User-Agent": "WeatherWiseApp/1.0"},
-                        timeout=10.0
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        for place in data:
-                            places.append({
-                                "name": place.get("display_name", "").split(",")[0],
-                                "lat": float(place.get("lat")),
-                                "lon": float(place.get("lon")),
-                                "type": query,
-                                "address": place.get("display_name", "")
-                            })
-            except Exception as e:
-                print(f"Error searching for {query}: {e}")
-                continue
-        
-        # Remove duplicates and limit results
-        unique_places = []
-        seen = set()
-        for place in places:
-            key = (place["lat"], place["lon"])
-            if key not in seen:
-                seen.add(key)
-                unique_places.append(place)
+        # Remove duplicates (nearby places with similar names) and limit results
+        unique_places = dedupe_place_dicts(places)
         
         return {"places": unique_places[:15]}  # Limit to 15 places
         
@@ -736,28 +2590,185 @@ async def get_activity_places(request: ActivityPlacesRequest):
         print(f"Error getting activity places: {e}")
         return {"places": []}
 
-async def fetch_weather_data(lat: float, lon: float):
+# Spatial snapping for the weather cache: nearby points share one forecast cell.
+# Open-Meteo's model grid is a few km wide, so a ~5km cell returns identical data.
+WEATHER_SNAP_MODE = os.getenv("WEATHER_SNAP_MODE", "geohash").lower()  # geohash | tile | off
+WEATHER_GEOHASH_PRECISION = int(os.getenv("WEATHER_GEOHASH_PRECISION", "5"))  # ~4.9km cells
+WEATHER_TILE_KM = float(os.getenv("WEATHER_TILE_KM", "5"))
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+KM_PER_DEGREE_LAT = 111.32
+
+@dataclass(frozen=True)
+class WeatherCell:
+    id: str
+    lat: float
+    lon: float
+    mode: str
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    """Encode coordinates as a geohash string"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """Return (lat_min, lat_max, lon_min, lon_max) of a geohash cell"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = _GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (bits >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+def snap_weather_cell(lat: float, lon: float) -> WeatherCell:
+    """Snap coordinates to the configured weather cell (its center is queried upstream)"""
+    lon = ((lon + 180.0) % 360.0) - 180.0
+    if WEATHER_SNAP_MODE == "geohash":
+        geohash = geohash_encode(lat, lon, WEATHER_GEOHASH_PRECISION)
+        lat_min, lat_max, lon_min, lon_max = geohash_bounds(geohash)
+        return WeatherCell(f"gh:{geohash}", round((lat_min + lat_max) / 2, 5),
+                           round((lon_min + lon_max) / 2, 5), "geohash")
+    if WEATHER_SNAP_MODE == "tile":
+        # Rows are fixed-height bands; columns widen toward the poles to stay ~N km
+        lat_step = WEATHER_TILE_KM / KM_PER_DEGREE_LAT
+        row = math.floor((lat + 90.0) / lat_step)
+        center_lat = min(90.0, -90.0 + (row + 0.5) * lat_step)
+        lon_step = min(360.0, lat_step / max(math.cos(math.radians(center_lat)), 0.01))
+        col = math.floor((lon + 180.0) / lon_step)
+        center_lon = -180.0 + (col + 0.5) * lon_step
+        return WeatherCell(f"tile:{WEATHER_TILE_KM:g}km:{row}:{col}", round(center_lat, 5),
+                           round(center_lon, 5), "tile")
+    return WeatherCell(f"{lat:.4f},{lon:.4f}", lat, lon, "off")
+
+# Only the Open-Meteo variables the responses actually render are requested
+OPEN_METEO_CURRENT_VARIABLES = "temperature_2m,relative_humidity_2m,apparent_temperature,precipitation,weather_code,wind_speed_10m,pressure_msl"
+OPEN_METEO_DAILY_VARIABLES = "weather_code,temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max"
+# Hourly variables clients may request: Open-Meteo name -> (response key, gap default, unit conversion, bucket aggregate)
+HOURLY_VARIABLES = {
+    "temperature_2m": ("temperature", 21, "c_to_f", "mean"),
+    "apparent_temperature": ("feelsLike", 21, "c_to_f", "mean"),
+    "relative_humidity_2m": ("humidity", 50, None, "mean"),
+    "precipitation": ("precipitation", 0, "mm_to_in", "sum"),
+    "precipitation_probability": ("precipitationProbability", 0, None, "max"),
+    "weather_code": ("condition", 0, None, "max"),  # Higher WMO codes are the more severe weather
+    "cloud_cover": ("cloudCover", 0, None, "mean"),
+    "wind_speed_10m": ("windSpeed", 10, "kmh_to_mph", "mean"),
+    "wind_gusts_10m": ("windGusts", 10, "kmh_to_mph", "max"),
+    "uv_index": ("uvIndex", 0, None, "max"),
+    "is_day": ("isDay", 1, None, "min"),  # A bucket counts as day only if every hour is
+    "visibility": ("visibility", 10000, "m_to_mi", "mean"),
+}
+DEFAULT_HOURLY_VARIABLES = ("temperature_2m", "precipitation", "weather_code", "wind_speed_10m")
+UNIT_CONVERSIONS = {  # (scale, offset)
+    "c_to_f": (9 / 5, 32), "mm_to_in": (0.0393701, 0), "kmh_to_mph": (0.621371, 0), "m_to_mi": (0.000621371, 0),
+}
+WEATHER_SECTIONS = ("current", "forecast", "historical", "cell", "hourly")
+MAX_FORECAST_DAYS = 16
+
+@dataclass(frozen=True)
+class WeatherView:
+    """What a client asked for: response sections, hourly variables, horizon and bucket size"""
+    sections: Tuple[str, ...] = ("current", "forecast", "historical", "cell")
+    hourly: Tuple[str, ...] = ()
+    days: int = 7
+    hours: Optional[int] = None
+    step: int = 1
+
+    def upstream_params(self) -> dict:
+        """Open-Meteo parameters covering exactly what this view renders"""
+        params = {"timezone": "auto", "forecast_days": self.days}
+        hourly = set(self.hourly)
+        if "current" in self.sections or "historical" in self.sections:
+            params["current"] = OPEN_METEO_CURRENT_VARIABLES
+            hourly |= {"uv_index", "visibility"}  # Current UV and visibility come from the hourly series
+        if hourly:
+            params["hourly"] = ",".join(sorted(hourly))
+        if "forecast" in self.sections:
+            params["daily"] = OPEN_METEO_DAILY_VARIABLES
+        return params
+
+    def cache_key(self, cell: WeatherCell) -> str:
+        """Cell id for the default payload; views needing other upstream data get their own entry"""
+        params = self.upstream_params()
+        if params == DEFAULT_WEATHER_PARAMS:
+            return cell.id
+        return cell.id + "|" + "&".join(f"{k}={params[k]}" for k in sorted(params))
+
+DEFAULT_WEATHER_VIEW = WeatherView()
+DEFAULT_WEATHER_PARAMS = DEFAULT_WEATHER_VIEW.upstream_params()
+
+def weather_view_from_request(request: WeatherViewOptions) -> WeatherView:
+    """Validate the optional shaping fields of a weather request"""
+    hourly = tuple(dict.fromkeys(request.hourly or ()))
+    unknown = [name for name in hourly if name not in HOURLY_VARIABLES]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown hourly variables: {', '.join(unknown)}")
+    if request.fields is None:
+        sections = DEFAULT_WEATHER_VIEW.sections + (("hourly",) if hourly else ())
+    else:
+        sections = tuple(dict.fromkeys(request.fields))
+        unknown = [name for name in sections if name not in WEATHER_SECTIONS]
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(unknown)}")
+    if "hourly" in sections and not hourly:
+        hourly = DEFAULT_HOURLY_VARIABLES
+    elif "hourly" not in sections:
+        hourly = ()
+    days = DEFAULT_WEATHER_VIEW.days if request.forecastDays is None else request.forecastDays
+    if not 1 <= days <= MAX_FORECAST_DAYS:
+        raise HTTPException(status_code=422, detail=f"forecastDays must be between 1 and {MAX_FORECAST_DAYS}")
+    if request.hours is not None and request.hours < 1:
+        raise HTTPException(status_code=422, detail="hours must be positive")
+    if not 1 <= request.hourlyStep <= 24:
+        raise HTTPException(status_code=422, detail="hourlyStep must be between 1 and 24")
+    return WeatherView(sections, hourly, days, request.hours, request.hourlyStep)
+
+def weather_cache_key(lat: float, lon: float, view: WeatherView = DEFAULT_WEATHER_VIEW) -> str:
+    """Weather key shared by the cache and single-flight: the snapped cell id (plus the view's upstream data)"""
+    return view.cache_key(snap_weather_cell(lat, lon))
+
+# Batch weather: cache misses are fetched WEATHER_BATCH_CHUNK coordinates per Open-Meteo request
+WEATHER_BATCH_CHUNK = int(os.getenv("WEATHER_BATCH_CHUNK", "50"))
+WEATHER_BATCH_MAX_LOCATIONS = int(os.getenv("WEATHER_BATCH_MAX_LOCATIONS", "200"))
+
+@cached_api_call("weather", key_fn=weather_cache_key)
+@single_flight("weather", key_fn=weather_cache_key)
+async def fetch_weather_data(lat: float, lon: float, view: WeatherView = DEFAULT_WEATHER_VIEW):
     """Fetch weather data from Open-Meteo (free)"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                OPEN_METEO_URL,
-                params={
-                    "latitude": lat,
-                    "longitude": lon,
-                    "current": "temperature_2m,relative_humidity_2m,apparent_temperature,precipitation,rain,showers,snowfall,weather_code,wind_speed_10m,wind_direction_10m,pressure_msl",
-                    "hourly": "temperature_2m,relative_humidity_2m,precipitation,weather_code,wind_speed_10m,uv_index,visibility",
-                    "daily": "weather_code,temperature_2m_max,temperature_2m_min,precipitation_sum,precipitation_hours,wind_speed_10m_max,uv_index_max",
-                    "timezone": "auto",
-                    "forecast_days": 7
-                },
-                timeout=10.0
-            )
+        client = http_clients.get("open_meteo")
+        response = await client.get(
+            OPEN_METEO_URL,
+            params={"latitude": lat, "longitude": lon, **view.upstream_params()},
+            timeout=10.0
+        )
             
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail="Weather API error")
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail="Weather API error")
             
-            return response.json()
+        return response.json()
             
     except Exception as e:
         print(f"Error fetching weather data: {e}")
@@ -778,7 +2789,8 @@ async def search_activity_places(request: PlaceSearchRequest):
         )
         
         places = []
-        for place in local_results:
+        for hit in local_results:
+            place = hit.place
             places.append({
                 "name": place.name,
                 "lat": place.lat,
@@ -786,7 +2798,9 @@ async def search_activity_places(request: PlaceSearchRequest):
                 "type": place.type,
                 "address": place.address,
                 "icon": "red",
-                "relevance_score": round(place.relevance_score, 2)
+                "relevance_score": round(hit.relevance_score, 2),
+                "distance_km": round(hit.distance_km, 2),
+                "sources": sorted({p["source"] for p in search_engine.get_provenance(hit.place_id)})
             })
         
         print(f"Local search found {len(places)} places for {request.activity}")
@@ -807,16 +2821,8 @@ async def search_activity_places(request: PlaceSearchRequest):
             request.lat, request.lon, request.activity, request.locationName
         )
         
-        # Combine and deduplicate results
-        all_places = places + api_places
-        unique_places = []
-        seen_coords = set()
-        
-        for place in all_places:
-            coord_key = (round(place["lat"], 4), round(place["lon"], 4))
-            if coord_key not in seen_coords:
-                seen_coords.add(coord_key)
-                unique_places.append(place)
+        # Combine and deduplicate results (local places win over their API duplicates)
+        unique_places = dedupe_place_dicts(places + api_places)
         
         print(f"Total unique places found: {len(unique_places)}")
         return {
@@ -839,151 +2845,336 @@ async def search_activity_places(request: PlaceSearchRequest):
             "error": str(e)
         }
 
+@single_flight("places", key_fn=external_places_key)
 async def search_external_places(lat: float, lon: float, activity: str, location_name: str) -> List[dict]:
     """Search external APIs for activity places"""
-    api_places = []
+    if place_provider is not None:
+        # Provider results are already indexed by fetch_area_places
+        return [{
+            "name": p.name,
+            "lat": p.lat,
+            "lon": p.lon,
+            "type": p.type,
+            "address": p.address or location_name,
+            "icon": "red"
+        } for p in await find_provider_places(lat, lon, activity)]
+    return await search_nominatim_places(lat, lon, activity, location_name)
+
+async def search_nominatim_places(lat: float, lon: float, activity: str, location_name: str) -> List[dict]:
+    """Legacy free-text Nominatim search (terms fan out concurrently)"""
     search_terms = ACTIVITY_SEARCH_TERMS.get(activity, [activity])
-    
-    for term in search_terms:
-        try:
-            async with httpx.AsyncClient() as client:
-                # Try different search patterns
-                search_patterns = [
-                    f"{term} in {location_name}",
-                    f"{term} near {location_name}",
-                    f"{term} {location_name}",
-                    term  # Just the term itself
-                ]
-                
-                for search_pattern in search_patterns:
-                    response = await client.get(
-                        "https://nominatim.openstreetmap.org/search",
-                        params={
-                            "q": search_pattern,
-                            "format": "json",
-                            "limit": 5,
-                            "viewbox": f"{lon-0.5},{lat-0.5},{lon+0.5},{lat+0.5}",
-                            "bounded": 1
-                        },
-                        headers={"User-Agent": "WeatherWiseApp/1.0"},
-                        timeout=6.0
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        print(f"Found {len(data)} results for '{search_pattern}'")
-                        
-                        for place in data:
-                            api_place = ActivityPlace(
-                                name=place.get("display_name", "").split(",")[0],
-                                lat=float(place.get("lat")),
-                                lon=float(place.get("lon")),
-                                type=term,
-                                address=place.get("display_name", ""),
-                                activity_type=activity
-                            )
-                            
-                            # Add to search engine for future queries
-                            search_engine.add_place(api_place)
-                            
-                            api_places.append({
-                                "name": api_place.name,
-                                "lat": api_place.lat,
-                                "lon": api_place.lon,
-                                "type": api_place.type,
-                                "address": api_place.address,
-                                "icon": "red"
-                            })
-                        
-                        # If we found results with this pattern, break
-                        if data:
-                            break
-                
-                # Small delay to be respectful to the API
-                await asyncio.sleep(0.2)
-                
-        except Exception as e:
-            print(f"Error searching for {term}: {e}")
-            continue
+    viewbox = f"{lon-0.5},{lat-0.5},{lon+0.5},{lat+0.5}"
+
+    def make_job(term: str):
+        async def job() -> List[ActivityPlace]:
+            # Try different search patterns until one returns results
+            search_patterns = [
+                f"{term} in {location_name}",
+                f"{term} near {location_name}",
+                f"{term} {location_name}",
+                term  # Just the term itself
+            ]
+            for search_pattern in search_patterns:
+                data = await nominatim_get({
+                    "q": search_pattern,
+                    "format": "json",
+                    "limit": 5,
+                    "viewbox": viewbox,
+                    "bounded": 1
+                }, timeout=6.0)
+                print(f"Found {len(data)} results for '{search_pattern}'")
+                if data:
+                    return [ActivityPlace(
+                        name=place.get("display_name", "").split(",")[0],
+                        lat=float(place.get("lat")),
+                        lon=float(place.get("lon")),
+                        type=term,
+                        address=place.get("display_name", ""),
+                        activity_type=activity,
+                        source="nominatim"
+                    ) for place in data]
+            return []
+        return job
+
+    found = await fan_out([make_job(term) for term in search_terms], target=PLACES_TARGET_RESULTS)
+
+    api_places = []
+    for api_place in found:
+        # Add to search engine for future queries
+        search_engine.add_place(api_place)
+        api_places.append({
+            "name": api_place.name,
+            "lat": api_place.lat,
+            "lon": api_place.lon,
+            "type": api_place.type,
+            "address": api_place.address,
+            "icon": "red"
+        })
     
     return api_places
 
+BULK_LOAD_BATCH_SIZE = int(os.getenv("BULK_LOAD_BATCH_SIZE", "5000"))
+BULK_LOAD_MAX_REJECTS_REPORTED = 100
+
+def parse_place_record(data: dict) -> ActivityPlace:
+    """Validate one bulk-load record; raises ValueError with a readable reason"""
+    name = (data.get("name") or "").strip()
+    if not name:
+        raise ValueError("missing name")
+    try:
+        lat, lon = float(data.get("lat")), float(data.get("lon"))
+    except (TypeError, ValueError):
+        raise ValueError("lat/lon must be numbers")
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        raise ValueError("lat/lon out of range")
+    return ActivityPlace(
+        name=name,
+        lat=lat,
+        lon=lon,
+        type=data.get("type") or "unknown",
+        address=data.get("address") or "",
+        activity_type=data.get("activity_type") or "general",
+        source=data.get("source") or "bulk"
+    )
+
 # NEW ENDPOINTS FOR PERFORMANCE MONITORING AND DATA MANAGEMENT
 @app.post("/api/places/bulk-load")
 async def bulk_load_places(request: BulkLoadRequest):
     """Bulk load places into the search engine"""
     try:
-        loaded_count = 0
-        for place_data in request.places:
-            place = ActivityPlace(
-                name=place_data.get("name"),
-                lat=place_data.get("lat"),
-                lon=place_data.get("lon"),
-                type=place_data.get("type", "unknown"),
-                address=place_data.get("address", ""),
-                activity_type=place_data.get("activity_type", "general")
-            )
-            search_engine.add_place(place)
-            loaded_count += 1
+        places, rejected = [], []
+        for row, place_data in enumerate(request.places):
+            try:
+                places.append(parse_place_record(place_data))
+            except ValueError as e:
+                rejected.append({"row": row, "error": str(e)})
+        loaded_count = search_engine.add_places(places)
         
         return {
             "message": f"Successfully loaded {loaded_count} places", 
             "status": "success",
-            "total_places": len(search_engine.coordinate_index)
+            "total_places": len(search_engine.store),
+            "rejected": len(rejected),
+            "rejected_rows": rejected[:BULK_LOAD_MAX_REJECTS_REPORTED]
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading places: {str(e)}")
 
+async def iter_body_lines(request: Request):
+    """Decode the request body into text lines without buffering it whole"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    remainder = ""
+    async for chunk in request.stream():
+        text = remainder + decoder.decode(chunk)
+        lines = text.split("\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line
+    remainder += decoder.decode(b"", final=True)
+    if remainder:
+        yield remainder
+
+def next_csv_row(reader):
+    """The reader's next row, or the parse error for a malformed record"""
+    try:
+        return next(reader)
+    except csv.Error as e:
+        return ValueError(f"invalid CSV: {e}")
+    except IndexError:
+        return ValueError("invalid CSV: unterminated quoted field")
+
+async def iter_csv_rows(lines):
+    """csv.reader over async text lines; quoted fields may span lines.
+
+    A record's lines are handed to one long-lived reader once its quotes
+    balance, so the reader never runs out of input mid-record.
+    """
+    pending: "deque[str]" = deque()
+    reader = csv.reader(iter(pending.popleft, None))
+    quotes = 0
+    async for line in lines:
+        if not pending and not line.strip():
+            continue
+        pending.append(line + "\n")
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            quotes = 0
+            while pending:
+                yield next_csv_row(reader)
+    while pending:
+        yield next_csv_row(reader)
+
+async def iter_place_records(request: Request, fmt: str):
+    """Yield (row_number, dict or parse error) from an NDJSON or CSV body"""
+    header = None
+    row = 0
+    if fmt == "csv":
+        async for values in iter_csv_rows(iter_body_lines(request)):
+            if header is None and not isinstance(values, Exception):
+                header = [h.strip() for h in values]
+                continue
+            row += 1
+            yield row, values if isinstance(values, Exception) else dict(zip(header, values))
+        return
+    async for line in iter_body_lines(request):
+        line = line.rstrip("\r")
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            record = json.loads(line)
+            yield row, record if isinstance(record, dict) else ValueError("record is not an object")
+        except json.JSONDecodeError as e:
+            yield row, ValueError(f"invalid JSON: {e.msg}")
+
+# Progress of streaming bulk loads, keyed by job id (readable while a load is running)
+bulk_load_jobs: "OrderedDict[str, dict]" = OrderedDict()
+
+@app.post("/api/places/bulk-load/stream")
+async def bulk_load_places_stream(request: Request, format: Optional[str] = None, job_id: Optional[str] = None):
+    """Stream NDJSON or CSV places from the request body, indexing them in batches.
+
+    The body is consumed chunk by chunk, so memory stays bounded by the batch
+    size. Progress is visible at /api/places/bulk-load/status while it runs.
+    """
+    content_type = request.headers.get("content-type", "")
+    fmt = (format or ("csv" if "csv" in content_type else "ndjson")).lower()
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=422, detail="format must be ndjson or csv")
+
+    job_id = job_id or f"bulk-{int(time.time() * 1000)}"
+    job = {"status": "running", "format": fmt, "processed": 0, "loaded": 0, "rejected": 0, "rejected_rows": []}
+    bulk_load_jobs[job_id] = job
+    while len(bulk_load_jobs) > 20:
+        bulk_load_jobs.popitem(last=False)
+
+    started = time.perf_counter()
+    batch: List[ActivityPlace] = []
+    try:
+        async for row, record in iter_place_records(request, fmt):
+            job["processed"] += 1
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                batch.append(parse_place_record(record))
+            except ValueError as e:
+                job["rejected"] += 1
+                if len(job["rejected_rows"]) < BULK_LOAD_MAX_REJECTS_REPORTED:
+                    job["rejected_rows"].append({"row": row, "error": str(e)})
+            if len(batch) >= BULK_LOAD_BATCH_SIZE:
+                job["loaded"] += search_engine.add_places(batch)
+                batch = []
+                print(f"Bulk load {job_id}: {job['processed']} processed, {job['loaded']} loaded, {job['rejected']} rejected")
+                await asyncio.sleep(0)  # Let searches run between batches
+        if batch:
+            job["loaded"] += search_engine.add_places(batch)
+        job["status"] = "success"
+    except Exception as e:
+        job["status"] = "error"
+        job["error"] = str(e)
+        print(f"Error streaming bulk load {job_id}: {e}")
+
+    job["duplicates"] = job["processed"] - job["rejected"] - job["loaded"]
+    job["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    job["total_places"] = len(search_engine.store)
+    if job["status"] == "error":
+        raise HTTPException(status_code=500, detail={"job_id": job_id, **job})
+    return {"job_id": job_id, **job}
+
+@app.get("/api/places/bulk-load/status")
+async def bulk_load_status(job_id: Optional[str] = None):
+    """Progress of a streaming bulk load (the most recent one by default)"""
+    if job_id is None:
+        if not bulk_load_jobs:
+            return {"jobs": []}
+        job_id = next(reversed(bulk_load_jobs))
+    job = bulk_load_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown bulk load job")
+    return {"job_id": job_id, **job}
+
 @app.get("/api/search/stats")
 async def get_search_stats():
     """Get statistics about the search engine"""
     stats = {
-        "total_places": len(search_engine.coordinate_index),
-        "places_by_activity": {k: len(v) for k, v in search_engine.places_by_activity.items()},
-        "grid_cells_used": len(search_engine.places_by_grid),
-        "unique_names": len(search_engine.name_index),
-        "cache_size": len(response_cache)
+        "total_places": len(search_engine.store),
+        "places_by_activity": {k: len(v) for k, v in search_engine.activity_spatial_index.items()},
+        "spatial_index": search_engine.index_stats(),
+        "memory_bytes": search_engine.memory_usage(),
+        "persistent_store": {
+            "path": place_db.path,
+            "written": place_db.written,
+            "loaded_tiles": len(search_engine.loaded_tiles),
+            "fully_loaded": search_engine.fully_loaded
+        } if place_db is not None else None,
+        "name_index": search_engine.name_index.stats(),
+        "location_index": location_index.stats(),
+        "gazetteer": {"cities": len(gazetteer), **gazetteer.index.stats(), **gazetteer.memory_usage()} if gazetteer else None,
+        "dedup": {
+            **search_engine.merge_stats,
+            "places_with_merged_sources": len(search_engine.provenance),
+            "merge_radius_m": PLACE_MERGE_RADIUS_KM * 1000,
+            "name_similarity": PLACE_MERGE_NAME_SIMILARITY
+        },
+        "cache_size": len(response_cache),
+        "cache": response_cache.stats(),
+        "single_flight": upstream_flights.stats(),
+        "advice_cache": {**advice_cache.stats(), "buckets": ADVICE_BUCKETS},
+        "llm_dispatch": llm_dispatcher.stats(),
+        "activity_scoring": dict(activity_scoring_stats),
+        "advice_streams": {**advice_stream_stats, "first_token": advice_first_token_latency.stats()},
+        "nominatim_rate_limit": {"rate": nominatim_limiter.rate, "waits": nominatim_limiter.waits},
+        "autocomplete": dict(autocomplete_stats),
+        "geocoding": {
+            "mode": GEOCODING_MODE,
+            "hedge_delay": GEOCODING_HEDGE_DELAY,
+            "latency": {provider: h.stats() for provider, h in geocoding_latency.items()}
+        }
     }
     return stats
 
 @app.get("/api/cache/clear")
 async def clear_cache():
-    """Clear response cache"""
-    global response_cache
-    cache_size = len(response_cache)
-    response_cache = {}
+    """Clear response and AI advice caches"""
+    cache_size = response_cache.clear() + advice_cache.clear()
     return {"message": f"Cache cleared, removed {cache_size} entries"}
 
 # ALL ORIGINAL WEATHER FUNCTIONS REMAIN EXACTLY THE SAME
 
+# WMO weather code -> condition, and condition -> emoji
+WEATHER_CODE_CONDITIONS = {
+    0: "clear", 1: "mainly clear", 2: "partly cloudy", 3: "overcast",
+    45: "foggy", 48: "foggy", 51: "drizzly", 53: "drizzly", 55: "drizzly",
+    56: "freezing drizzle", 57: "freezing drizzle", 61: "rainy", 63: "rainy",
+    65: "rainy", 66: "freezing rain", 67: "freezing rain", 71: "snowy",
+    73: "snowy", 75: "snowy", 77: "snowy", 80: "rainy", 81: "rainy",
+    82: "rainy", 85: "snowy", 86: "snowy", 95: "stormy",
+    96: "stormy", 99: "stormy"
+}
+CONDITION_EMOJIS = {
+    "clear": "☀️",
+    "mainly clear": "🌤️",
+    "partly cloudy": "⛅",
+    "overcast": "☁️",
+    "foggy": "🌫️",
+    "drizzly": "🌧️",
+    "rainy": "🌧️",
+    "snowy": "❄️",
+    "stormy": "⛈️"
+}
+# Dense lookup tables indexed by WMO code (0-99) for converting whole forecast columns at once
+WMO_CODE_COUNT = 100
+CONDITION_TABLE = np.array([WEATHER_CODE_CONDITIONS.get(code, "clear") for code in range(WMO_CODE_COUNT)], dtype=object)
+CONDITION_EMOJI_TABLE = np.array([CONDITION_EMOJIS.get(c, "🌤️") for c in CONDITION_TABLE], dtype=object)
+
 def parse_weather_code(code: int) -> str:
     """Convert WMO weather code to condition string"""
-    weather_codes = {
-        0: "clear", 1: "mainly clear", 2: "partly cloudy", 3: "overcast",
-        45: "foggy", 48: "foggy", 51: "drizzly", 53: "drizzly", 55: "drizzly",
-        56: "freezing drizzle", 57: "freezing drizzle", 61: "rainy", 63: "rainy",
-        65: "rainy", 66: "freezing rain", 67: "freezing rain", 71: "snowy",
-        73: "snowy", 75: "snowy", 77: "snowy", 80: "rainy", 81: "rainy",
-        82: "rainy", 85: "snowy", 86: "snowy", 95: "stormy",
-        96: "stormy", 99: "stormy"
-    }
-    return weather_codes.get(code, "clear")
+    return WEATHER_CODE_CONDITIONS.get(code, "clear")
 
 def get_condition_emoji(condition: str) -> str:
     """Get emoji for weather condition"""
-    emoji_map = {
-        "clear": "☀️",
-        "mainly clear": "🌤️",
-        "partly cloudy": "⛅",
-        "overcast": "☁️",
-        "foggy": "🌫️",
-        "drizzly": "🌧️",
-        "rainy": "🌧️",
-        "snowy": "❄️",
-        "stormy": "⛈️"
-    }
-    return emoji_map.get(condition, "🌤️")
+    return CONDITION_EMOJIS.get(condition, "🌤️")
 
 def estimate_cloud_cover(weather_code: int) -> int:
     """Estimate cloud cover percentage from weather code"""
@@ -1010,92 +3201,196 @@ def mm_to_inches(mm: float) -> float:
     """Convert mm to inches"""
     return mm * 0.0393701
 
+# Daily forecast variables used by the response, with the value used for gaps
+DAILY_FORECAST_COLUMNS = (
+    ("temperature_2m_max", 21), ("temperature_2m_min", 21), ("precipitation_sum", 0),
+    ("wind_speed_10m_max", 10), ("weather_code", 0),
+)
+
+def forecast_matrix(block: dict, columns, length: int) -> np.ndarray:
+    """Stack forecast variables into a (columns x length) float array; gaps and missing keys become defaults"""
+    rows = []
+    for key, default in columns:
+        values = list((block.get(key) or [])[:length])
+        rows.append(values + [default] * (length - len(values)))
+    matrix = np.array(rows, dtype=np.float64)
+    defaults = np.array([default for _, default in columns], dtype=np.float64)[:, None]
+    return np.where(np.isnan(matrix), defaults, matrix)
+
+@lru_cache(maxsize=1024)
+def forecast_date_label(date_str: str) -> str:
+    """"Sat, Oct 17" for a forecast date; every request shares the same few dates"""
+    return datetime.fromisoformat(date_str).strftime("%a, %b %d")
+
+def current_hour_index(times: List[str], utc_offset_seconds: Optional[int] = None) -> Optional[int]:
+    """Index of the first hourly timestamp at or after the current hour (binary search)"""
+    if not times:
+        return None
+    if utc_offset_seconds is not None:
+        # Open-Meteo times are local to the forecast location
+        now = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=utc_offset_seconds)
+    else:
+        now = datetime.now()
+    # ISO-8601 timestamps in one format sort lexicographically, so bisect the strings as-is
+    index = bisect.bisect_left(times, now.strftime("%Y-%m-%dT%H:00"))
+    return index if index < len(times) else None
+
+def transform_daily_forecast(daily: dict, days: int = 7) -> List[dict]:
+    """Convert the daily forecast columns to imperial units and labels in one vectorized pass"""
+    n = min(days, len(daily.get("time") or []))
+    if n == 0:
+        return []
+    matrix = forecast_matrix(daily, DAILY_FORECAST_COLUMNS, n)
+    high_f, low_f = matrix[0] * 9 / 5 + 32, matrix[1] * 9 / 5 + 32
+    codes = matrix[4].astype(np.int64)
+    codes = np.where((codes >= 0) & (codes < WMO_CODE_COUNT), codes, 0)  # Unknown codes read as clear
+    avg, high, low, precip, wind = np.round(np.vstack([
+        (high_f + low_f) / 2, high_f, low_f, matrix[2] * 0.0393701, matrix[3] * 0.621371
+    ]), 1).tolist()
+
+    columns = zip(
+        [forecast_date_label(date) for date in daily["time"][:n]], avg, high, low, precip, wind,
+        CONDITION_TABLE[codes].tolist(), CONDITION_EMOJI_TABLE[codes].tolist()
+    )
+    return [{
+        "date": label,
+        "temperature": avg,
+        "high": high,
+        "low": low,
+        "precipitation": precip,
+        "windSpeed": wind,
+        "wind": wind,
+        "humidity": 65,  # Approximate from historical averages
+        "condition": condition,
+        "conditionEmoji": emoji
+    } for label, avg, high, low, precip, wind, condition, emoji in columns]
+
+def hourly_matrix(hourly: dict, names, utc_offset_seconds: Optional[int] = None,
+                  hours: Optional[int] = None) -> Tuple[List[str], np.ndarray]:
+    """Hourly variables in display units from the current hour on: (times, names x hours array)"""
+    times = hourly.get("time") or []
+    start = current_hour_index(times, utc_offset_seconds)
+    start = len(times) if start is None else start
+    end = len(times) if hours is None else min(len(times), start + hours)
+    n = end - start
+    if n <= 0:
+        return [], np.empty((len(names), 0))
+
+    specs = [HOURLY_VARIABLES[name] for name in names]
+    window = {name: (hourly.get(name) or [])[start:end] for name in names}
+    matrix = forecast_matrix(window, [(name, spec[1]) for name, spec in zip(names, specs)], n)
+    for row, (_, _, conversion, _) in enumerate(specs):
+        if conversion:
+            scale, offset = UNIT_CONVERSIONS[conversion]
+            matrix[row] = matrix[row] * scale + offset
+    return times[start:end], matrix
+
+def transform_hourly_series(hourly: dict, view: WeatherView, utc_offset_seconds: Optional[int] = None) -> dict:
+    """Requested hourly variables from the current hour on, optionally bucketed into view.step hours"""
+    times, matrix = hourly_matrix(hourly, view.hourly, utc_offset_seconds, view.hours)
+    n = len(times)
+    series = {"time": [], "step": view.step}
+    specs = [HOURLY_VARIABLES[name] for name in view.hourly]
+    if n == 0:
+        series.update({key: [] for key, *_ in specs})
+        return series
+
+    # Bucket with reduceat; the last bucket may be short
+    starts = np.arange(0, n, view.step)
+    if view.step > 1:
+        sizes = np.diff(np.append(starts, n))
+        sums = np.add.reduceat(matrix, starts, axis=1)
+        means = sums / sizes
+        maxes = np.maximum.reduceat(matrix, starts, axis=1)
+        mins = np.minimum.reduceat(matrix, starts, axis=1)
+        by_aggregate = {"mean": means, "sum": sums, "max": maxes, "min": mins}
+        matrix = np.vstack([by_aggregate[aggregate][row] for row, (*_, aggregate) in enumerate(specs)])
+
+    series["time"] = [times[i] for i in starts.tolist()]
+    for row, (key, _, _, _) in enumerate(specs):
+        if key == "condition":
+            codes = matrix[row].astype(np.int64)
+            series[key] = CONDITION_TABLE[np.where((codes >= 0) & (codes < WMO_CODE_COUNT), codes, 0)].tolist()
+        else:
+            series[key] = np.round(matrix[row], 1).tolist()
+    return series
+
+def build_current_weather(weather_data: dict) -> dict:
+    """Current conditions in imperial units"""
+    current = weather_data.get("current", {})
+    hourly = weather_data.get("hourly", {})
+    
+    # Get current UV index (the current block has none, so take the hourly value for this hour)
+    uv_index = current.get("uv_index")
+    if uv_index is None:
+        hour = current_hour_index(hourly.get("time", []), weather_data.get("utc_offset_seconds"))
+        uv_values = hourly.get("uv_index") or []
+        uv_index = uv_values[hour] if hour is not None and hour < len(uv_values) else None
+    if uv_index is None:
+        uv_index = 5
+    
+    weather_code = current.get("weather_code", 0)
+    condition = parse_weather_code(weather_code)
+    
+    # Convert units from metric to imperial
+    temp_f = celsius_to_fahrenheit(current.get("temperature_2m", 21))
+    wind_mph = kmh_to_mph(current.get("wind_speed_10m", 10))
+    precip_inches = mm_to_inches(current.get("precipitation", 0))
+    
+    current_weather = {
+        "temperature": round(temp_f, 1),
+        "windSpeed": round(wind_mph, 1),
+        "humidity": current.get("relative_humidity_2m", 50),
+        "precipitation": round(precip_inches, 1),
+        "uvIndex": round(uv_index, 1),
+        "condition": condition,
+        "conditionEmoji": get_condition_emoji(condition),
+        "cloudCover": estimate_cloud_cover(weather_code),
+        "visibility": round((hourly.get("visibility", [10000])[0] / 1000) * 0.621371, 1) if hourly.get("visibility") else 6.2,  # km to miles
+        "dewPoint": round(celsius_to_fahrenheit(current.get("apparent_temperature", 18)), 1),
+        "pressure": round(current.get("pressure_msl", 1013)),
+        "description": condition.replace("_", " ").title()
+    }
+    return current_weather
+
+def build_weather_response(weather_data: dict, lat: float, lon: float, cell: WeatherCell,
+                           view: WeatherView = DEFAULT_WEATHER_VIEW) -> dict:
+    """Shape an Open-Meteo forecast into the /api/weather/fetch response (only the view's sections)"""
+    response = {}
+    current_weather = None
+    if "current" in view.sections or "historical" in view.sections:
+        current_weather = build_current_weather(weather_data)
+    if "current" in view.sections:
+        response["current"] = current_weather
+    
+    # Parse forecast
+    if "forecast" in view.sections:
+        response["forecast"] = transform_daily_forecast(weather_data.get("daily", {}), view.days)
+    
+    # Generate historical data based on location and season
+    if "historical" in view.sections:
+        response["historical"] = generate_historical_data(lat, lon, current_weather["temperature"])
+    
+    if "cell" in view.sections:
+        response["cell"] = {"id": cell.id, "lat": cell.lat, "lon": cell.lon, "mode": cell.mode}
+    if "hourly" in view.sections:
+        response["hourly"] = transform_hourly_series(
+            weather_data.get("hourly", {}), view, weather_data.get("utc_offset_seconds")
+        )
+    return response
+
 @app.post("/api/weather/fetch")
 async def fetch_real_weather(request: LocationWeatherRequest):
     """Fetch real-time weather data for a location using free APIs"""
     print(f"Fetching weather for: {request.locationName} ({request.lat}, {request.lon})")
     
     try:
-        weather_data = await fetch_weather_data(request.lat, request.lon)
+        # Query the snapped cell center so every point in the cell shares one entry
+        view = weather_view_from_request(request)
+        cell = snap_weather_cell(request.lat, request.lon)
+        weather_data = await fetch_weather_data(cell.lat, cell.lon, view)
         
-        # Parse current weather
-        current = weather_data.get("current", {})
-        hourly = weather_data.get("hourly", {})
-        daily = weather_data.get("daily", {})
-        
-        # Get current UV index
-        uv_index = current.get("uv_index", 5)
-        if not uv_index and hourly.get("uv_index"):
-            now = datetime.now()
-            current_hour = now.replace(minute=0, second=0, microsecond=0)
-            for i, time_str in enumerate(hourly["time"]):
-                if datetime.fromisoformat(time_str.replace('Z', '+00:00')) >= current_hour:
-                    uv_index = hourly["uv_index"][i]
-                    break
-        
-        weather_code = current.get("weather_code", 0)
-        condition = parse_weather_code(weather_code)
-        
-        # Convert units from metric to imperial
-        temp_f = celsius_to_fahrenheit(current.get("temperature_2m", 21))
-        wind_mph = kmh_to_mph(current.get("wind_speed_10m", 10))
-        precip_inches = mm_to_inches(current.get("precipitation", 0))
-        
-        current_weather = {
-            "temperature": round(temp_f, 1),
-            "windSpeed": round(wind_mph, 1),
-            "humidity": current.get("relative_humidity_2m", 50),
-            "precipitation": round(precip_inches, 1),
-            "uvIndex": round(uv_index, 1),
-            "condition": condition,
-            "conditionEmoji": get_condition_emoji(condition),
-            "cloudCover": estimate_cloud_cover(weather_code),
-            "visibility": round((hourly.get("visibility", [10000])[0] / 1000) * 0.621371, 1) if hourly.get("visibility") else 6.2,  # km to miles
-            "dewPoint": round(celsius_to_fahrenheit(current.get("apparent_temperature", 18)), 1),
-            "pressure": round(current.get("pressure_msl", 1013)),
-            "description": condition.replace("_", " ").title()
-        }
-        
-        # Parse forecast
-        forecast = []
-        if daily.get("time"):
-            for i in range(min(7, len(daily["time"]))):
-                date_str = daily["time"][i]
-                condition_code = daily["weather_code"][i]
-                condition_str = parse_weather_code(condition_code)
-                
-                # Convert temperatures to Fahrenheit
-                high_f = celsius_to_fahrenheit(daily["temperature_2m_max"][i])
-                low_f = celsius_to_fahrenheit(daily["temperature_2m_min"][i])
-                avg_temp = (high_f + low_f) / 2
-                
-                # Convert precipitation to inches
-                precip_inches = mm_to_inches(daily.get("precipitation_sum", [0]*7)[i])
-                
-                # Convert wind to mph
-                wind_mph = kmh_to_mph(daily.get("wind_speed_10m_max", [10]*7)[i])
-                
-                forecast.append({
-                    "date": datetime.fromisoformat(date_str).strftime("%a, %b %d"),
-                    "temperature": round(avg_temp, 1),
-                    "high": round(high_f, 1),
-                    "low": round(low_f, 1),
-                    "precipitation": round(precip_inches, 1),
-                    "windSpeed": round(wind_mph, 1),
-                    "wind": round(wind_mph, 1),
-                    "humidity": 65,  # Approximate from historical averages
-                    "condition": condition_str,
-                    "conditionEmoji": get_condition_emoji(condition_str)
-                })
-        
-        # Generate historical data based on location and season
-        historical = generate_historical_data(request.lat, request.lon, current_weather["temperature"])
-        
-        return {
-            "current": current_weather,
-            "forecast": forecast,
-            "historical": historical
-        }
+        return build_weather_response(weather_data, request.lat, request.lon, cell, view)
     
     except HTTPException as e:
         raise e
@@ -1103,6 +3398,99 @@ async def fetch_real_weather(request: LocationWeatherRequest):
         print(f"Error in fetch_real_weather: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def fetch_weather_chunk(cells: List[WeatherCell], view: WeatherView = DEFAULT_WEATHER_VIEW) -> Dict[str, dict]:
+    """One multi-coordinate Open-Meteo request; returns forecast data per cell id"""
+    client = http_clients.get("open_meteo")
+    response = await client.get(
+        OPEN_METEO_URL,
+        params={
+            "latitude": ",".join(str(cell.lat) for cell in cells),
+            "longitude": ",".join(str(cell.lon) for cell in cells),
+            **view.upstream_params()
+        },
+        timeout=15.0
+    )
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Weather API error")
+    data = response.json()
+    if isinstance(data, dict):  # A single coordinate comes back as an object, not a list
+        data = [data]
+    if len(data) != len(cells):
+        raise HTTPException(status_code=502, detail="Weather API returned the wrong number of locations")
+    return {cell.id: cell_data for cell, cell_data in zip(cells, data)}
+
+async def fetch_weather_cells(cells: List[WeatherCell],
+                              view: WeatherView = DEFAULT_WEATHER_VIEW) -> Tuple[Dict[str, object], dict]:
+    """Forecast data (or the exception) per cell id, batching cache misses into chunked requests.
+
+    Misses go through the weather single-flight, so single-location fetches of the same cell
+    running at the same time share the batch request and vice versa.
+    """
+    unique = list({cell.id: cell for cell in cells}.values())
+    data: Dict[str, object] = {}
+    misses = []
+    for cell in unique:
+        cached = response_cache.get("weather", view.cache_key(cell))
+        if cached is _MISSING:
+            misses.append(cell)
+        else:
+            data[cell.id] = cached
+
+    chunk_tasks: Dict[str, asyncio.Task] = {}
+    to_fetch = [cell for cell in misses if not upstream_flights.in_flight("weather", view.cache_key(cell))]
+    for i in range(0, len(to_fetch), WEATHER_BATCH_CHUNK):
+        chunk = to_fetch[i:i + WEATHER_BATCH_CHUNK]
+        task = asyncio.ensure_future(fetch_weather_chunk(chunk, view))
+        for cell in chunk:
+            chunk_tasks[cell.id] = task
+
+    async def fetch_cell(cell: WeatherCell):
+        task = chunk_tasks.get(cell.id) or asyncio.ensure_future(fetch_weather_chunk([cell], view))
+        cell_data = (await task)[cell.id]
+        response_cache.set("weather", view.cache_key(cell), cell_data, CACHE_TTLS["weather"])
+        return cell_data
+
+    # Register every flight before awaiting so concurrent callers can join them
+    flights = [upstream_flights.start("weather", view.cache_key(cell), lambda cell=cell: fetch_cell(cell))
+               for cell in misses]
+    results = await asyncio.gather(*(asyncio.shield(flight) for flight in flights), return_exceptions=True)
+    data.update(zip((cell.id for cell in misses), results))
+    return data, {
+        "cells": len(unique),
+        "cache_hits": len(unique) - len(misses),
+        "upstream_requests": len({id(task) for task in chunk_tasks.values()}),
+        "coalesced": len(misses) - len(to_fetch)
+    }
+
+@app.post("/api/weather/batch")
+async def fetch_weather_batch(request: BatchWeatherRequest):
+    """Weather for many locations at once; results are in request order, shaped like /api/weather/fetch"""
+    if len(request.locations) > WEATHER_BATCH_MAX_LOCATIONS:
+        raise HTTPException(status_code=422, detail=f"At most {WEATHER_BATCH_MAX_LOCATIONS} locations per batch")
+    print(f"Fetching batch weather for {len(request.locations)} locations")
+    
+    view = weather_view_from_request(request)
+    cells = [snap_weather_cell(loc.lat, loc.lon) for loc in request.locations]
+    data_by_cell, stats = await fetch_weather_cells(cells, view)
+    
+    results = []
+    for loc, cell in zip(request.locations, cells):
+        result = {"locationName": loc.locationName, "lat": loc.lat, "lon": loc.lon}
+        data = data_by_cell[cell.id]
+        if isinstance(data, BaseException):
+            detail = data.detail if isinstance(data, HTTPException) else str(data)
+            print(f"Error in batch weather for {loc.locationName}: {detail}")
+            result["error"] = detail
+        else:
+            try:
+                result["weather"] = build_weather_response(data, loc.lat, loc.lon, cell, view)
+            except Exception as e:
+                print(f"Error in batch weather for {loc.locationName}: {e}")
+                result["error"] = str(e)
+        results.append(result)
+    
+    return {"results": results, **stats}
+
 def generate_historical_data(lat: float, lon: float, current_temp: float) -> dict:
     """Generate realistic historical data based on location and current temperature"""
     # Simple logic based on latitude and current temperature
@@ -1121,17 +3509,282 @@ def generate_historical_data(lat: float, lon: float, current_temp: float) -> dic
         "recordLow": round(current_temp - 30, 1)
     }
 
-@app.post("/api/analyze")
-async def analyze_weather(request: WeatherRequest):
-    print(f"Received request: {request}")
-    
-    api_key = os.getenv('GROQ_API_KEY')
-    if not api_key:
-        print("ERROR: GROQ_API_KEY not found in environment variables")
-        raise HTTPException(status_code=500, detail="API key not configured")
+# Rule-based activity scoring
+
+# Per-activity comfort profile: ideal temperature band (°F) and how far outside it
+# conditions stay tolerable, wind caution/limit (mph), precipitation caution/limit
+# (inches in an hour) and the UV index where sun protection becomes a concern.
+ACTIVITY_PROFILE_FIELDS = ("temp_low", "temp_high", "temp_tolerance", "wind_caution", "wind_limit",
+                           "precip_caution", "precip_limit", "uv_caution")
+ACTIVITY_PROFILES = {
+    "beach": (75, 92, 12, 12, 25, 0.01, 0.15, 8),
+    "hiking": (45, 75, 15, 15, 30, 0.03, 0.3, 8),
+    "camping": (50, 80, 15, 12, 28, 0.02, 0.25, 9),
+    "picnic": (65, 84, 12, 10, 20, 0.01, 0.1, 8),
+    "sports": (55, 82, 14, 12, 25, 0.02, 0.2, 8),
+    "photo": (35, 88, 20, 18, 35, 0.05, 0.4, 11),
+    "general": (55, 85, 15, 15, 28, 0.02, 0.25, 8),  # Activities we don't have a profile for
+}
+_unprofiled = set(ACTIVITY_SEARCH_TERMS) - set(ACTIVITY_PROFILES)
+if _unprofiled:  # Searchable activities would otherwise be scored with the "general" profile
+    raise RuntimeError(f"ACTIVITY_PROFILES is missing searchable activities: {sorted(_unprofiled)}")
+ACTIVITY_IDS = tuple(ACTIVITY_PROFILES)
+ACTIVITY_ROWS = {activity: row for row, activity in enumerate(ACTIVITY_IDS)}
+ACTIVITY_PROFILE_MATRIX = np.array([ACTIVITY_PROFILES[a] for a in ACTIVITY_IDS], dtype=np.float64)
+
+ACTIVITY_RATINGS = ("POOR", "FAIR", "GOOD", "GREAT", "EXCELLENT")
+RATING_THRESHOLDS = np.array([35, 55, 70, 85])  # Score cut-offs between consecutive ratings
+RISK_FLAGS = ("heat", "cold", "wind", "strong_wind", "rain", "heavy_rain", "high_uv", "muggy")
+RISK_FLAG_NOTES = {
+    "heat": "heat is a concern, so plan for shade and extra water",
+    "cold": "it will be cold, so dress in warm layers",
+    "wind": "expect noticeable wind",
+    "strong_wind": "winds are strong enough to be hazardous",
+    "rain": "rain is likely, so bring a waterproof layer",
+    "heavy_rain": "heavy rain is expected",
+    "high_uv": "UV is high, so use sunscreen and limit midday exposure",
+    "muggy": "humidity will make it feel muggy",
+}
+DAILY_PRECIP_SCALE = 4.0  # Daily totals fall over several hours, so their thresholds scale up
+
+@dataclass(frozen=True)
+class ActivityScores:
+    """Scores (0-100), rating indexes and risk flags for activities x readings"""
+    activities: Tuple[str, ...]
+    scores: np.ndarray  # (activities, readings)
+    ratings: np.ndarray  # (activities, readings) index into ACTIVITY_RATINGS
+    flags: np.ndarray  # (len(RISK_FLAGS), activities, readings) bool
+
+    def entry(self, a: int, n: int) -> dict:
+        return {
+            "score": round(float(self.scores[a, n]), 1),
+            "rating": ACTIVITY_RATINGS[self.ratings[a, n]],
+            "flags": [flag for flag, raised in zip(RISK_FLAGS, self.flags[:, a, n]) if raised],
+        }
+
+def resolve_activity(name: str) -> str:
+    """Map a display name like "Beach" or "Photography" onto a scoring profile"""
+    key = normalize_query_key(name)
+    if key in ACTIVITY_ROWS:
+        return key
+    for activity in ACTIVITY_SEARCH_TERMS:
+        if key.startswith(activity) or activity in key.split():
+            return activity
+    return "general"
+
+def score_activity_conditions(temperature, wind, precipitation, humidity, uv,
+                              activities: Tuple[str, ...] = ACTIVITY_IDS, precip_scale: float = 1.0) -> ActivityScores:
+    """Score every activity against every reading in one vectorized pass.
+
+    Condition arguments are equal-length sequences in imperial units. Each
+    profile limit subtracts a capped penalty from 100: temperature outside the
+    ideal band, wind past caution, precipitation past caution, muggy heat and UV.
+    """
+    profile = ACTIVITY_PROFILE_MATRIX[[ACTIVITY_ROWS[a] for a in activities]].T[:, :, None]
+    temp_low, temp_high, tolerance, wind_caution, wind_limit, precip_caution, precip_limit, uv_caution = profile
+    precip_caution, precip_limit = precip_caution * precip_scale, precip_limit * precip_scale
+    t, w, p, h, u = np.array([temperature, wind, precipitation, humidity, uv], dtype=np.float64)[:, None, :]
+
+    outside = np.maximum(temp_low - t, 0) + np.maximum(t - temp_high, 0)
+    muggy = (h >= 80) & (t >= 78)
+    penalty = (
+        np.minimum(outside / tolerance * 30, 70)
+        + np.minimum(np.maximum(w - wind_caution, 0) / (wind_limit - wind_caution) * 30, 60)
+        + np.minimum(np.maximum(p - precip_caution, 0) / (precip_limit - precip_caution) * 40, 60)
+        + np.clip(h - 70, 0, 30) / 3 * (t >= 75)
+        + np.clip(u - uv_caution, 0, 5) * 3
+    )
+    scores = np.clip(100 - penalty, 0, 100)
+    flags = np.stack(np.broadcast_arrays(
+        t > temp_high + tolerance / 2, t < temp_low - tolerance / 2, w >= wind_caution, w >= wind_limit,
+        p >= precip_caution, p >= precip_limit, u >= uv_caution, muggy
+    ))
+    return ActivityScores(tuple(activities), scores, np.searchsorted(RATING_THRESHOLDS, scores, side="right"), flags)
+
+def rate_weather_request(request: WeatherRequest) -> dict:
+    """Rule-based rating for one activity under the request's current conditions"""
+    activity = resolve_activity(request.activityName)
+    scores = score_activity_conditions([request.temperature], [request.windSpeed], [request.precipitation],
+                                       [request.humidity], [request.uvIndex], activities=(activity,))
+    return {"activity": activity, **scores.entry(0, 0)}
+
+def rule_based_advice(request: WeatherRequest, rating: dict) -> str:
+    """Short advice text built from the rule-based rating, for when prose isn't needed or available"""
+    notes = [RISK_FLAG_NOTES[flag] for flag in rating["flags"] if flag in RISK_FLAG_NOTES]
+    outlook = "; ".join(notes) if notes else "no weather risks stand out"
+    return (f"**{request.activityName} rating: {rating['rating']}** "
+            f"Conditions in {request.locationName} score {rating['score']:.0f}/100: {request.temperature:.0f}°F, "
+            f"wind {request.windSpeed:.0f} mph, precipitation {request.precipitation:.2f} inches, "
+            f"humidity {request.humidity:.0f}%, UV index {request.uvIndex:.0f}. {outlook[0].upper()}{outlook[1:]}.")
+
+activity_scoring_stats: Dict[str, int] = defaultdict(int)
+
+@app.post("/api/activities/score")
+async def score_activities(request: ActivityScoreRequest):
+    """Rate activities for each supplied reading (e.g. every forecast day) without an LLM call"""
+    if not request.conditions:
+        return {"activities": {}, "best": {}}
+    activities = tuple(dict.fromkeys(resolve_activity(a) for a in request.activities)) if request.activities \
+        else tuple(ACTIVITY_SEARCH_TERMS)
+    readings = request.conditions
+    scores = score_activity_conditions(
+        [r.temperature for r in readings], [r.windSpeed for r in readings], [r.precipitation for r in readings],
+        [r.humidity for r in readings], [r.uvIndex for r in readings],
+        activities=activities, precip_scale=DAILY_PRECIP_SCALE if request.period == "day" else 1.0
+    )
+    activity_scoring_stats["score_requests"] += 1
+    best = np.argmax(scores.scores, axis=1)
+    return {
+        "activities": {
+            activity: [{"date": r.date, **scores.entry(a, n)} for n, r in enumerate(readings)]
+            for a, activity in enumerate(activities)
+        },
+        "best": {activity: {"index": int(best[a]), "date": readings[best[a]].date, **scores.entry(a, int(best[a]))}
+                 for a, activity in enumerate(activities)}
+    }
+
+# Best time windows: sliding windows over the hourly forecast, scored per activity
+
+BEST_WINDOW_HOURLY = ("temperature_2m", "wind_speed_10m", "precipitation", "relative_humidity_2m", "uv_index", "is_day")
+BEST_WINDOW_MAX_HOURS = 12
+BEST_WINDOW_MAX_TOP = 10
+BEST_WINDOW_MIN_WEIGHT = 0.3  # Share of a window's score taken from its worst hour
+DAYLIGHT_ACTIVITIES = frozenset(ACTIVITY_IDS) - {"camping"}
+
+def hour_after(time_str: str) -> str:
+    return (datetime.fromisoformat(time_str) + timedelta(hours=1)).isoformat(timespec="minutes")
+
+def find_best_windows(weather_data: dict, activities: Tuple[str, ...], window_hours: int, top: int) -> Dict[str, List[dict]]:
+    """Top non-overlapping windows per activity from an hourly forecast.
+
+    Hours are scored for every activity in one pass, then each window of
+    window_hours consecutive hours is scored as a blend of its mean and its
+    worst hour, so one stormy hour sinks an otherwise pleasant afternoon.
+    Daylight activities only get windows where every hour is daytime.
+    """
+    times, matrix = hourly_matrix(weather_data.get("hourly", {}), BEST_WINDOW_HOURLY,
+                                  weather_data.get("utc_offset_seconds"))
+    if len(times) < window_hours:
+        return {activity: [] for activity in activities}
+    temperature, wind, precipitation, humidity, uv, is_day = matrix
+    hourly = score_activity_conditions(temperature, wind, precipitation, humidity, uv, activities=activities)
+
+    windows = sliding_window_view(hourly.scores, window_hours, axis=1)  # (activities, starts, hours)
+    window_scores = (1 - BEST_WINDOW_MIN_WEIGHT) * windows.mean(axis=-1) + BEST_WINDOW_MIN_WEIGHT * windows.min(axis=-1)
+    daylight = sliding_window_view(is_day >= 0.5, window_hours).all(axis=-1)
+    needs_daylight = np.array([activity in DAYLIGHT_ACTIVITIES for activity in activities])[:, None]
+    window_scores = np.where(needs_daylight & ~daylight, -1.0, window_scores)
+    ratings = np.searchsorted(RATING_THRESHOLDS, window_scores, side="right")
+    order = np.argsort(-window_scores, axis=1, kind="stable")  # Ties go to the earlier window
+
+    results = {}
+    for a, activity in enumerate(activities):
+        picked = []
+        taken = np.zeros(len(times), dtype=bool)
+        for start in order[a].tolist():
+            if len(picked) == top or window_scores[a, start] < 0:
+                break
+            end = start + window_hours
+            if taken[start:end].any():
+                continue
+            taken[start:end] = True
+            picked.append({
+                "start": times[start],
+                "end": hour_after(times[end - 1]),
+                "score": round(float(window_scores[a, start]), 1),
+                "rating": ACTIVITY_RATINGS[ratings[a, start]],
+                "flags": [flag for flag, raised in zip(RISK_FLAGS, hourly.flags[:, a, start:end].any(axis=1)) if raised],
+                "temperature": round(float(temperature[start:end].mean()), 1),
+                "maxWindSpeed": round(float(wind[start:end].max()), 1),
+                "precipitation": round(float(precipitation[start:end].sum()), 2),
+                "maxUvIndex": round(float(uv[start:end].max()), 1),
+            })
+        results[activity] = picked
+    return results
+
+def best_windows_key(lat: float, lon: float, activities: Tuple[str, ...], window_hours: int, top: int, days: int) -> str:
+    """One entry per forecast tile and query shape"""
+    return f"{snap_weather_cell(lat, lon).id}|{days}d|{window_hours}h|top{top}|{','.join(activities)}"
+
+@cached_api_call("best_windows", key_fn=best_windows_key)
+async def compute_best_windows(lat: float, lon: float, activities: Tuple[str, ...], window_hours: int,
+                               top: int, days: int) -> Dict[str, List[dict]]:
+    cell = snap_weather_cell(lat, lon)
+    view = WeatherView(sections=("hourly",), hourly=BEST_WINDOW_HOURLY, days=days)
+    weather_data = await fetch_weather_data(cell.lat, cell.lon, view)
+    return find_best_windows(weather_data, activities, window_hours, top)
+
+@app.post("/api/weather/best-times")
+async def best_times(request: BestTimesRequest):
+    """Best upcoming time windows per activity, from the hourly forecast and the scoring rules"""
+    if not 1 <= request.windowHours <= BEST_WINDOW_MAX_HOURS:
+        raise HTTPException(status_code=422, detail=f"windowHours must be between 1 and {BEST_WINDOW_MAX_HOURS}")
+    if not 1 <= request.top <= BEST_WINDOW_MAX_TOP:
+        raise HTTPException(status_code=422, detail=f"top must be between 1 and {BEST_WINDOW_MAX_TOP}")
+    if not 1 <= request.days <= MAX_FORECAST_DAYS:
+        raise HTTPException(status_code=422, detail=f"days must be between 1 and {MAX_FORECAST_DAYS}")
+    activities = tuple(dict.fromkeys(resolve_activity(a) for a in request.activities)) if request.activities \
+        else tuple(ACTIVITY_SEARCH_TERMS)
     
-    try:
-        prompt = f"""You are WeatherWise Pro AI, an elite outdoor activity planning assistant.
+    windows = await compute_best_windows(request.lat, request.lon, activities, request.windowHours,
+                                         request.top, request.days)
+    return {
+        "cell": snap_weather_cell(request.lat, request.lon).id,
+        "windowHours": request.windowHours,
+        "activities": windows
+    }
+
+# AI advice (Groq chat completions)
+
+GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = "llama-3.3-70b-versatile"
+ANALYZE_MAX_TOKENS = 400
+INSIGHTS_MAX_TOKENS = 200
+
+# Groq dispatch: bounded concurrency, priority queue, retries and load shedding
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))  # Waiting requests beyond this are shed
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))  # seconds
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+LLM_DEGRADED_RETRY_AFTER = int(os.getenv("LLM_DEGRADED_RETRY_AFTER", "10"))
+LLM_PRIORITY_INTERACTIVE = 0  # Activity advice: a user is waiting on it
+LLM_PRIORITY_BACKGROUND = 1  # Forecast insights: supplementary text
+
+def quantize(value: float, width: float):
+    """Bucket index for a reading; a width of 0 keeps the exact value"""
+    return round(value / width) if width > 0 else value
+
+def activity_advice_key(request: WeatherRequest) -> str:
+    """Advice cache key: activity, location and bucketed weather readings"""
+    return "|".join([
+        normalize_query_key(request.activityName),
+        normalize_query_key(request.locationName),
+        normalize_query_key(request.locationCountry),
+        f"t{quantize(request.temperature, ADVICE_BUCKETS['temperature'])}",
+        f"w{quantize(request.windSpeed, ADVICE_BUCKETS['wind'])}",
+        f"p{quantize(request.precipitation, ADVICE_BUCKETS['precipitation'])}",
+        f"h{quantize(request.humidity, ADVICE_BUCKETS['humidity'])}",
+        f"uv{quantize(request.uvIndex, ADVICE_BUCKETS['uv'])}",
+        rate_weather_request(request)["rating"],  # Prose must agree with the rating we return
+    ])
+
+def forecast_insights_key(request: ForecastInsightRequest) -> str:
+    """Insights cache key: location plus each day's date, condition and bucketed readings"""
+    days = [
+        f"{day.date},{day.condition.lower()},"
+        f"{quantize(day.temperature, ADVICE_BUCKETS['temperature'])},"
+        f"{quantize(day.precipitation, ADVICE_BUCKETS['precipitation_chance'])},"
+        f"{quantize(day.windSpeed, ADVICE_BUCKETS['wind'])},"
+        f"{quantize(day.humidity, ADVICE_BUCKETS['humidity'])}"
+        for day in request.forecast
+    ]
+    return "|".join([normalize_query_key(request.locationName), normalize_query_key(request.locationCountry), *days])
+
+def activity_advice_prompt(request: WeatherRequest) -> str:
+    rating = rate_weather_request(request)
+    risks = ", ".join(flag.replace("_", " ") for flag in rating["flags"]) or "none"
+    return f"""You are WeatherWise Pro AI, an elite outdoor activity planning assistant.
 
 Weather Data for {request.locationName}, {request.locationCountry}:
 - Temperature: {request.temperature}°F
@@ -1142,8 +3795,10 @@ Weather Data for {request.locationName}, {request.locationCountry}:
 
 Planned Activity: {request.activityName}
 
+Our scoring rules rate this {rating['rating']} ({rating['score']:.0f}/100). Flagged risks: {risks}.
+
 Provide expert analysis with:
-1. Activity rating (EXCELLENT/GREAT/GOOD/FAIR/POOR)
+1. Activity rating: use {rating['rating']} exactly as given
 2. Key insights about conditions (2-3 sentences)
 3. One pro tip specific to this activity
 4. Risk mitigation advice
@@ -1154,80 +3809,360 @@ Write 4-5 concise sentences total. Be confident and use meteorological terminolo
 
 Keep response under 300 words."""
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "llama-3.3-70b-versatile",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "max_tokens": 400,
-                    "temperature": 0.7
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail="AI API Error")
-            
-            data = response.json()
-            advice = data["choices"][0]["message"]["content"]
-            return {"advice": advice}
+def forecast_insights_prompt(request: ForecastInsightRequest) -> str:
+    forecast_text = ""
+    for day in request.forecast:
+        forecast_text += f"\n- {day.date}: {day.condition}, {day.temperature}°F, Precipitation: {day.precipitation}%, Wind: {day.windSpeed} mph, Humidity: {day.humidity}%"
+
+    return f"""You are a weather forecasting assistant. Analyze this forecast for {request.locationName}, {request.locationCountry}:
+{forecast_text}
+
+Provide a friendly 2-3 sentence summary that:
+1. Highlights key weather patterns or changes
+2. Mentions precipitation or extreme conditions
+3. Gives practical advice
+
+Start naturally like "Expect..." or "This week brings...". Keep under 100 words."""
+
+def groq_request(prompt: str, max_tokens: int, stream: bool = False) -> dict:
+    """Headers and body for a single-turn Groq chat completion"""
+    return {
+        "headers": {
+            "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",
+            "Content-Type": "application/json"
+        },
+        "json": {
+            "model": GROQ_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+            "stream": stream
+        },
+        "timeout": 30.0
+    }
+
+async def groq_chat_completion(prompt: str, max_tokens: int) -> str:
+    """Single-turn Groq chat completion, returning the message text"""
+    client = http_clients.get("groq")
+    response = await client.post(GROQ_CHAT_URL, **groq_request(prompt, max_tokens))
+
+    if response.status_code != 200:
+        raise groq_error(response)
+
+    data = response.json()
+    return data["choices"][0]["message"]["content"]
+
+def groq_error(response: httpx.Response) -> HTTPException:
+    """Upstream failure as an HTTPException, keeping Retry-After for the retry loop"""
+    retry_after = response.headers.get("retry-after")
+    return HTTPException(status_code=response.status_code, detail="AI API Error",
+                         headers={"Retry-After": retry_after} if retry_after else None)
+
+class LLMOverloaded(Exception):
+    """Raised when the LLM queue is full and a request is shed"""
+
+def llm_error_status(error: Exception) -> Optional[int]:
+    if isinstance(error, HTTPException):
+        return error.status_code
+    if isinstance(error, httpx.TransportError):  # Connect errors and timeouts
+        return 503
+    return None
+
+def llm_retryable(error: Exception) -> bool:
+    status = llm_error_status(error)
+    return status is not None and (status == 429 or status >= 500)
+
+def llm_degradable(error: Exception) -> bool:
+    """Shed or still rate limited after retries: answer with the degraded fallback"""
+    return isinstance(error, LLMOverloaded) or llm_error_status(error) == 429
+
+class LLMDispatcher:
+    """Runs Groq calls through a fixed number of slots, handed out in priority order.
+
+    Waiters sit in a heap of (priority, sequence, future); a finished call hands its
+    slot straight to the next live waiter. When the queue is full new requests are
+    shed with LLMOverloaded instead of piling more connections onto the upstream.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_retries: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.active = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = 0
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.wait_latency = LatencyHistogram()
+
+    async def _acquire(self, priority: int):
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            return
+        if self.waiting >= self.max_queue:
+            self.counts["shed"] += 1
+            raise LLMOverloaded(f"LLM queue full ({self.waiting} waiting)")
         
+        future = asyncio.get_running_loop().create_future()
+        self._sequence += 1
+        heapq.heappush(self._queue, (priority, self._sequence, future))
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        started = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()  # The slot was handed over just as we were cancelled
+            raise
+        finally:
+            self.waiting -= 1
+        self.wait_latency.observe(time.perf_counter() - started, "ok")
+
+    def _release(self):
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():  # Skip waiters that were cancelled
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int):
+        """Hold one concurrency slot, e.g. for the length of a streamed completion"""
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def backoff(self, error: Exception, attempt: int):
+        """Sleep before a retry: the upstream's Retry-After, else full-jitter exponential"""
+        self.counts["retries"] += 1
+        delay = None
+        retry_after = (getattr(error, "headers", None) or {}).get("Retry-After")
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                pass  # HTTP-date form, fall back to our own backoff
+        if delay is None:
+            delay = random.uniform(0, LLM_RETRY_BASE_DELAY * 2 ** attempt)
+        delay = min(delay, LLM_RETRY_MAX_DELAY)
+        print(f"LLM call failed ({llm_error_status(error)}), retry {attempt + 1} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    async def _call(self, factory):
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await factory()
+                self.counts["completed"] += 1
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries or not llm_retryable(e):
+                    self.counts["failed"] += 1
+                    raise
+                await self.backoff(e, attempt)
+
+    async def run(self, priority: int, factory):
+        """Run factory() in a slot with retries; raises LLMOverloaded when shed"""
+        self.counts["submitted"] += 1
+        await self._acquire(priority)
+        try:
+            return await self._call(factory)
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            **self.counts,
+            "queue_wait": self.wait_latency.stats()
+        }
+
+llm_dispatcher = LLMDispatcher(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_MAX_RETRIES)
+
+def degraded_advice(request: WeatherRequest) -> str:
+    """Fallback advice when the LLM is saturated: the rule-based rating without prose"""
+    return rule_based_advice(request, rate_weather_request(request)) + " Detailed AI advice is busy right now."
+
+def degraded_insights(request: ForecastInsightRequest) -> str:
+    """Fallback forecast summary from the raw numbers"""
+    if not request.forecast:
+        return "Forecast insights are busy right now. Please try again in a moment."
+    temperatures = [day.temperature for day in request.forecast]
+    wettest = max(request.forecast, key=lambda day: day.precipitation)
+    return (f"Expect temperatures between {min(temperatures):.0f}°F and {max(temperatures):.0f}°F "
+            f"across the {len(request.forecast)}-day forecast, with the highest chance of precipitation "
+            f"({wettest.precipitation:.0f}%) on {wettest.date}. Detailed insights are busy right now.")
+
+def degraded_response(payload: dict) -> JSONResponse:
+    return JSONResponse({**payload, "degraded": True}, headers={"Retry-After": str(LLM_DEGRADED_RETRY_AFTER)})
+
+@cached_api_call("analyze", key_fn=activity_advice_key, cache=advice_cache)
+@single_flight("analyze", key_fn=activity_advice_key)
+async def generate_activity_advice(request: WeatherRequest) -> str:
+    prompt = activity_advice_prompt(request)
+    return await llm_dispatcher.run(LLM_PRIORITY_INTERACTIVE, lambda: groq_chat_completion(prompt, ANALYZE_MAX_TOKENS))
+
+@cached_api_call("forecast_insights", key_fn=forecast_insights_key, cache=advice_cache)
+@single_flight("forecast_insights", key_fn=forecast_insights_key)
+async def generate_insights_text(request: ForecastInsightRequest) -> str:
+    prompt = forecast_insights_prompt(request)
+    return await llm_dispatcher.run(LLM_PRIORITY_BACKGROUND, lambda: groq_chat_completion(prompt, INSIGHTS_MAX_TOKENS))
+
+# Streaming (Server-Sent Events) mode for the advice endpoints
+
+advice_stream_stats: Dict[str, int] = defaultdict(int)
+advice_first_token_latency = LatencyHistogram()
+
+async def groq_chat_stream(prompt: str, max_tokens: int):
+    """Stream a Groq chat completion, yielding content deltas as they arrive"""
+    client = http_clients.get("groq")
+    async with client.stream("POST", GROQ_CHAT_URL, **groq_request(prompt, max_tokens, stream=True)) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise groq_error(response)
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+            choices = json.loads(payload).get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def wants_event_stream(request: Request, stream: bool) -> bool:
+    """Streaming is opted into with ?stream=true or an Accept: text/event-stream header"""
+    return stream or "text/event-stream" in request.headers.get("accept", "")
+
+async def stream_advice(namespace: str, key: str, prompt: str, max_tokens: int, field: str,
+                        priority: int, fallback: str, meta: Optional[dict] = None):
+    """SSE body proxying Groq deltas; cached advice is sent as a single delta.
+
+    Events: an optional "rating" event carrying meta, unnamed {"delta"} chunks,
+    then "done" with the full text, or "error".
+    The stream holds a dispatcher slot and retries only before its first delta;
+    when shed or rate limited, the fallback text is sent as a degraded "done".
+    The completed text fills the advice cache; a client disconnect closes the
+    generator, which closes the upstream stream without caching the partial text.
+    """
+    yield ": stream open\n\n"  # Flush headers before the upstream answers
+    if meta is not None:
+        yield sse_event(meta, event="rating")
+    cached = advice_cache.get(namespace, key)
+    if cached is not _MISSING:
+        advice_stream_stats["cache_hits"] += 1
+        yield sse_event({"delta": cached})
+        yield sse_event({field: cached, "cached": True}, event="done")
+        return
+    
+    started = time.perf_counter()
+    parts: List[str] = []
+    outcome = "error"
+    try:
+        async with llm_dispatcher.slot(priority):
+            attempt = 0
+            while True:
+                try:
+                    async with aclosing(groq_chat_stream(prompt, max_tokens)) as deltas:
+                        async for delta in deltas:
+                            if not parts:
+                                advice_first_token_latency.observe(time.perf_counter() - started, "ok")
+                            parts.append(delta)
+                            yield sse_event({"delta": delta})
+                    break
+                except Exception as e:
+                    if parts or attempt >= llm_dispatcher.max_retries or not llm_retryable(e):
+                        raise
+                    await llm_dispatcher.backoff(e, attempt)
+                    attempt += 1
+        text = "".join(parts)
+        if text:
+            advice_cache.set(namespace, key, text, advice_cache.ttls[namespace])
+        outcome = "completed"
+        yield sse_event({field: text, "cached": False}, event="done")
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "disconnected"
+        raise
     except Exception as e:
+        if not parts and llm_degradable(e):
+            outcome = "degraded"
+            yield sse_event({"delta": fallback})
+            yield sse_event({field: fallback, "cached": False, "degraded": True}, event="done")
+        else:
+            print(f"Error streaming {namespace}: {e}")
+            yield sse_event({"detail": str(e)}, event="error")
+    finally:
+        advice_stream_stats[outcome] += 1
+
+def event_stream_response(body) -> StreamingResponse:
+    # X-Accel-Buffering stops nginx-style proxies from holding chunks back
+    return StreamingResponse(body, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/api/analyze")
+async def analyze_weather(request: WeatherRequest, http_request: Request, stream: bool = False, prose: bool = True):
+    """Rule-based rating for the activity, plus LLM-written advice unless prose=false"""
+    print(f"Received request: {request}")
+    rating = rate_weather_request(request)
+    
+    api_key = os.getenv('GROQ_API_KEY')
+    if not api_key:
+        print("ERROR: GROQ_API_KEY not found in environment variables, answering from scoring rules")
+    if not prose or not api_key:
+        activity_scoring_stats["rules_only"] += 1
+        return {"advice": rule_based_advice(request, rating), "rating": rating, "source": "rules"}
+    activity_scoring_stats["with_prose"] += 1
+    
+    if wants_event_stream(http_request, stream):
+        return event_stream_response(stream_advice(
+            "analyze", activity_advice_key(request), activity_advice_prompt(request), ANALYZE_MAX_TOKENS, "advice",
+            LLM_PRIORITY_INTERACTIVE, degraded_advice(request), meta=rating))
+    
+    try:
+        advice = await generate_activity_advice(request)
+        return {"advice": advice, "rating": rating, "source": "llm"}
+        
+    except Exception as e:
+        if llm_degradable(e):
+            print(f"Serving degraded advice: {e}")
+            return degraded_response({"advice": degraded_advice(request), "rating": rating, "source": "rules"})
         print(f"Error in analyze_weather: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/forecast-insights")
-async def generate_forecast_insights(request: ForecastInsightRequest):
+async def generate_forecast_insights(request: ForecastInsightRequest, http_request: Request, stream: bool = False):
     print(f"Received forecast insight request for: {request.locationName}")
     
     api_key = os.getenv('GROQ_API_KEY')
     if not api_key:
         raise HTTPException(status_code=500, detail="API key not configured")
     
+    if wants_event_stream(http_request, stream):
+        return event_stream_response(stream_advice(
+            "forecast_insights", forecast_insights_key(request), forecast_insights_prompt(request),
+            INSIGHTS_MAX_TOKENS, "insights", LLM_PRIORITY_BACKGROUND, degraded_insights(request)))
+    
     try:
-        forecast_text = ""
-        for day in request.forecast:
-            forecast_text += f"\n- {day.date}: {day.condition}, {day.temperature}°F, Precipitation: {day.precipitation}%, Wind: {day.windSpeed} mph, Humidity: {day.humidity}%"
-        
-        prompt = f"""You are a weather forecasting assistant. Analyze this forecast for {request.locationName}, {request.locationCountry}:
-{forecast_text}
-
-Provide a friendly 2-3 sentence summary that:
-1. Highlights key weather patterns or changes
-2. Mentions precipitation or extreme conditions
-3. Gives practical advice
-
-Start naturally like "Expect..." or "This week brings...". Keep under 100 words."""
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "llama-3.3-70b-versatile",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "max_tokens": 200,
-                    "temperature": 0.7
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail="AI API Error")
-            
-            data = response.json()
-            insights = data["choices"][0]["message"]["content"]
-            return {"insights": insights}
+        insights = await generate_insights_text(request)
+        return {"insights": insights}
         
     except Exception as e:
+        if llm_degradable(e):
+            print(f"Serving degraded insights: {e}")
+            return degraded_response({"insights": degraded_insights(request)})
         print(f"Error generating insights: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1241,9 +4176,12 @@ async def health_check():
     return {
         "status": "healthy",
         "groq_api_configured": bool(groq_key),
-        "free_apis_used": "open-meteo, openstreetmap-nominatim",
+        "free_apis_used": "open-meteo, openstreetmap-nominatim, overpass",
+        "place_provider": place_provider.name if place_provider else "nominatim",
+        "http2_enabled": HTTP2_ENABLED,
         "search_engine_stats": {
-            "total_places": len(search_engine.coordinate_index),
-            "cache_size": len(response_cache)
+            "total_places": len(search_engine.store),
+            "cache_size": len(response_cache),
+            "persistent_store": place_db is not None
         }
     }
\ No newline at end of file